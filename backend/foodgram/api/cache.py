@@ -0,0 +1,182 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from recipes.images import RENDITION_SIZES
+from recipes.models import RecipeQuerySet, Tag
+
+from users.serializers import get_followed_authors
+from .serializers import RecipeGetSerializer
+
+RECIPES_VERSION_KEY = 'recipes:version'
+RECIPE_PAYLOAD_TIMEOUT = 60 * 60 * 24
+CATALOG_CONTENT_MAX_SIZE = 256
+SHOPPING_CART_TIMEOUT = 60 * 60 * 24
+
+_catalog_lock = threading.Lock()
+_catalog_content = OrderedDict()
+_tags_by_slug = {}
+
+
+def recipe_version_key(pk):
+    return f'recipe:{pk}:version'
+
+
+def author_version_key(pk):
+    return f'author:{pk}:version'
+
+
+def catalog_version_key(catalog):
+    return f'catalog:{catalog}:version'
+
+
+def shopping_cart_version_key(user_id):
+    return f'shopping_cart:{user_id}:version'
+
+
+def new_version():
+    """Versions start from the current time, so a version evicted
+    from the cache never matches payloads stored under its old values"""
+    return int(time.time() * 1000)
+
+
+def _increment_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, new_version(), None)
+
+
+def bump_version(key):
+    """Bumps the version when the current transaction is committed:
+    a bump made earlier would let concurrent requests cache the old rows
+    under the new version"""
+    transaction.on_commit(partial(_increment_version, key))
+
+
+def get_versions(keys):
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return versions
+
+
+def get_recipes_data(recipes, context):
+    """Serializes recipes with RecipeGetSerializer.
+    Recipe fields, author, tags and ingredients are taken from the cache,
+    keyed by the global, per-recipe and per-author versions; only missed
+    recipes are loaded and serialized. The per-user flags are overlaid
+    afterwards."""
+    request = context['request']
+    recipes = list(recipes)
+    versions = get_versions(
+        [RECIPES_VERSION_KEY]
+        + [recipe_version_key(recipe.pk) for recipe in recipes]
+        + list({author_version_key(recipe.author_id) for recipe in recipes})
+    )
+    base_url = hashlib.md5(
+        request.build_absolute_uri('/').encode()).hexdigest()[:16]
+    image_size = request.query_params.get('image_size', '')
+    if image_size not in RENDITION_SIZES:
+        image_size = ''
+    keys = {
+        recipe.pk: 'recipe:{}:payload:{}:{}:{}:{}:{}'.format(
+            recipe.pk,
+            versions[RECIPES_VERSION_KEY],
+            versions[recipe_version_key(recipe.pk)],
+            versions[author_version_key(recipe.author_id)],
+            base_url,
+            image_size
+        ) for recipe in recipes
+    }
+    payloads = cache.get_many(list(keys.values()))
+    missing = [recipe for recipe in recipes if keys[recipe.pk] not in payloads]
+    if missing:
+        prefetch_related_objects(
+            missing, 'author', *RecipeQuerySet.payload_prefetches())
+        fresh = dict(zip(
+            (keys[recipe.pk] for recipe in missing),
+            RecipeGetSerializer(missing, many=True, context=context).data
+        ))
+        cache.set_many(fresh, RECIPE_PAYLOAD_TIMEOUT)
+        payloads.update(fresh)
+
+    serializer = RecipeGetSerializer(recipes, many=True, context=context)
+    followed_authors = get_followed_authors(request)
+    data = []
+    for recipe in recipes:
+        payload = payloads[keys[recipe.pk]]
+        payload['is_favorited'] = serializer.child.get_is_favorited(recipe)
+        payload['is_in_shopping_cart'] = (
+            serializer.child.get_is_in_shopping_cart(recipe))
+        payload['author']['is_subscribed'] = (
+            payload['author']['id'] in followed_authors)
+        data.append(payload)
+    return data
+
+
+def get_catalog_etag(catalog, full_path, media_type):
+    """Strong ETag of a catalog response: the catalog version
+    and a digest of the requested path with its query
+    and of the media type it is rendered in"""
+    key = catalog_version_key(catalog)
+    version = get_versions([key])[key]
+    digest = hashlib.md5(
+        f'{media_type} {full_path}'.encode()).hexdigest()[:16]
+    return f'"{catalog}-{version}-{digest}"'
+
+
+def get_catalog_content(etag):
+    """Serialized bytes of a catalog response kept in process"""
+    with _catalog_lock:
+        content = _catalog_content.get(etag)
+        if content is not None:
+            _catalog_content.move_to_end(etag)
+        return content
+
+
+def set_catalog_content(etag, content):
+    with _catalog_lock:
+        _catalog_content[etag] = content
+        while len(_catalog_content) > CATALOG_CONTENT_MAX_SIZE:
+            _catalog_content.popitem(last=False)
+
+
+def get_tags_by_slug():
+    """Returns {slug: id} of all tags, reloaded when the catalog changes"""
+    key = catalog_version_key('tags')
+    version = get_versions([key])[key]
+    with _catalog_lock:
+        if _tags_by_slug.get('version') == version:
+            return _tags_by_slug['tags']
+    tags = dict(Tag.objects.values_list('slug', 'id'))
+    with _catalog_lock:
+        _tags_by_slug.update(version=version, tags=tags)
+    return tags
+
+
+def get_shopping_cart_key(user, file_format):
+    """Key of a rendered shopping list: changes with the user's cart
+    and with recipes and ingredients"""
+    cart_key = shopping_cart_version_key(user.pk)
+    versions = get_versions([cart_key, RECIPES_VERSION_KEY])
+    return 'shopping_cart:{}:{}:{}:{}'.format(
+        user.pk, file_format,
+        versions[cart_key], versions[RECIPES_VERSION_KEY]
+    )
+
+
+def cache_stream(key, chunks, timeout=SHOPPING_CART_TIMEOUT):
+    """Passes the chunks through and caches them joined at the end"""
+    content = []
+    for chunk in chunks:
+        content.append(chunk)
+        yield chunk
+    cache.set(key, b''.join(content), timeout)
@@ -1,22 +1,48 @@
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Ingredient, Recipe
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+
+from .cache import get_tags_by_slug
+
+
+def tag_choices():
+    return [(slug, slug) for slug in get_tags_by_slug()]
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug'
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='tags_filter'
     )
     is_favorited = filters.BooleanFilter(method='is_favorited_filter')
     is_in_shopping_cart = filters.BooleanFilter(
         method='is_in_shopping_cart_filter'
     )
+    search = filters.CharFilter(method='search_filter')
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author')
 
+    def tags_filter(self, queryset, name, value):
+        """Method for filtering recipes by tag slugs, resolved to ids
+        from the in-process map of tags"""
+        if not value:
+            return queryset
+        tags_by_slug = get_tags_by_slug()
+        return queryset.filter(
+            tags__in=[tags_by_slug[slug] for slug in value]
+        ).distinct()
+
+    def search_filter(self, queryset, name, value):
+        """Method for searching recipes by name and text,
+        ranked by relevance"""
+        value = value.strip()
+        if not value:
+            return queryset
+        return queryset.search(value)
+
     def is_favorited_filter(self, queryset, name, value):
         """Method for filtering recipes depending on "favorited" or not"""
         user = self.request.user
@@ -38,3 +64,23 @@ class IngredientFilter(FilterSet):
     class Meta:
         model = Ingredient
         fields = ('name', )
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """?ordering= by the view's "ordering_fields", newer recipes
+    first among equal ones. Search results keep their relevance order,
+    so ?ordering= together with ?search= is rejected."""
+    search_param = 'search'
+    search_ordering_message = (
+        'Результаты поиска упорядочены по релевантности, '
+        'сортировка с поиском не используется.')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and request.query_params.get(
+                self.search_param, '').strip():
+            raise ValidationError(
+                {self.ordering_param: self.search_ordering_message})
+        if ordering:
+            return (*ordering, '-pub_date', '-id')
+        return ordering
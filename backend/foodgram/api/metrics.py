@@ -0,0 +1,270 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from functools import partial
+
+from django.conf import settings
+from django.db import connections
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                    1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+FLUSH_INTERVAL = 1.0
+UNRESOLVED_VIEW = 'unresolved'
+
+
+def view_name(view_func, method):
+    """RecipeViewSet.list for viewset actions, the class name
+    for other DRF views and module.function for plain views"""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower())
+    if action is None:
+        return view_class.__name__
+    return f'{view_class.__name__}.{action}'
+
+
+def new_entry():
+    return {
+        'duration': [0] * (len(DURATION_BUCKETS) + 1),
+        'duration_sum': 0.0,
+        'queries': [0] * (len(QUERY_BUCKETS) + 1),
+        'queries_sum': 0,
+        'db_seconds': 0.0,
+        'bytes': 0,
+        'statuses': {},
+    }
+
+
+def merge_entries(target, source):
+    for name in ('duration', 'queries'):
+        target[name] = [a + b for a, b in zip(target[name], source[name])]
+    for name in ('duration_sum', 'queries_sum', 'db_seconds', 'bytes'):
+        target[name] += source[name]
+    for status, count in source['statuses'].items():
+        target['statuses'][status] = (
+            target['statuses'].get(status, 0) + count)
+
+
+class Registry:
+    """Request metrics of this process keyed by "view method".
+    With the METRICS_DIRECTORY setting every process writes its
+    metrics to <directory>/<pid>.json at most once per FLUSH_INTERVAL,
+    and collect() merges the files of all processes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.entries = {}
+        self.flushed = 0.0
+
+    def observe(self, view, method, status, duration, queries,
+                db_seconds, size):
+        with self.lock:
+            if self.pid != os.getpid():
+                # forked with the parent's metrics, e.g. gunicorn --preload
+                self.reset()
+            entry = self.entries.setdefault(f'{view} {method}', new_entry())
+            entry['duration'][bisect_left(DURATION_BUCKETS, duration)] += 1
+            entry['duration_sum'] += duration
+            entry['queries'][bisect_left(QUERY_BUCKETS, queries)] += 1
+            entry['queries_sum'] += queries
+            entry['db_seconds'] += db_seconds
+            entry['bytes'] += size
+            status = str(status)
+            entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+        if time.monotonic() - self.flushed >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        directory = settings.METRICS_DIRECTORY
+        if not directory:
+            return
+        with self.lock:
+            content = json.dumps(self.entries)
+            self.flushed = time.monotonic()
+        path = os.path.join(directory, f'{self.pid}.json')
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(temporary, 'w') as file:
+                file.write(content)
+            os.replace(temporary, path)
+        except OSError:
+            pass
+
+    def collect(self):
+        """Metrics of all processes merged by "view method"."""
+        directory = settings.METRICS_DIRECTORY
+        if not directory:
+            with self.lock:
+                return json.loads(json.dumps(self.entries))
+        self.flush()
+        merged = {}
+        try:
+            filenames = sorted(os.listdir(directory))
+        except OSError:
+            filenames = []
+        for filename in filenames:
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as file:
+                    entries = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for key, entry in entries.items():
+                merge_entries(merged.setdefault(key, new_entry()), entry)
+        return merged
+
+
+registry = Registry()
+
+
+class QueryObserver:
+    """execute_wrapper counting queries and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MeteredStream:
+    """Streaming content counting its size. The request is recorded
+    and the query observer removed when the response is closed."""
+
+    def __init__(self, content, stack, record):
+        self.content = content
+        self.stack = stack
+        self.record = record
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.content:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        if self.record is None:
+            return
+        self.stack.close()
+        self.record(self.size)
+        self.record = None
+
+
+class MetricsMiddleware:
+    """Records latency, SQL queries and time, response size and status
+    of every request under the name of its view and action.
+    Streaming responses are recorded when they are closed."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        observer = QueryObserver()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(observer))
+            response = self.get_response(request)
+            if response.streaming:
+                response.streaming_content = MeteredStream(
+                    response.streaming_content, stack.pop_all(),
+                    partial(self.record, request, response, started,
+                            observer))
+                return response
+        self.record(request, response, started, observer,
+                    len(response.content))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = view_name(view_func, request.method)
+
+    def record(self, request, response, started, observer, size):
+        registry.observe(
+            getattr(request, 'metrics_view', UNRESOLVED_VIEW),
+            request.method,
+            response.status_code,
+            time.perf_counter() - started,
+            observer.count,
+            observer.seconds,
+            size
+        )
+
+
+def escape(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def histogram_lines(name, labels, buckets, counts, total):
+    cumulative = 0
+    for bound, count in zip((*buckets, '+Inf'), counts):
+        cumulative += count
+        yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+    yield f'{name}_sum{{{labels}}} {total}'
+    yield f'{name}_count{{{labels}}} {cumulative}'
+
+
+def render_metrics(entries):
+    """Metrics in the Prometheus text exposition format 0.0.4"""
+    items = []
+    for key in sorted(entries):
+        view, method = key.rsplit(' ', 1)
+        labels = f'view="{escape(view)}",method="{escape(method)}"'
+        items.append((labels, entries[key]))
+    lines = [
+        '# HELP foodgram_http_requests_total Requests by view and status.',
+        '# TYPE foodgram_http_requests_total counter',
+    ]
+    for labels, entry in items:
+        for status, count in sorted(entry['statuses'].items()):
+            lines.append(f'foodgram_http_requests_total'
+                         f'{{{labels},status="{status}"}} {count}')
+    lines += [
+        '# HELP foodgram_http_request_duration_seconds Request latency.',
+        '# TYPE foodgram_http_request_duration_seconds histogram',
+    ]
+    for labels, entry in items:
+        lines.extend(histogram_lines(
+            'foodgram_http_request_duration_seconds', labels,
+            DURATION_BUCKETS, entry['duration'], entry['duration_sum']))
+    lines += [
+        '# HELP foodgram_http_request_db_queries SQL queries per request.',
+        '# TYPE foodgram_http_request_db_queries histogram',
+    ]
+    for labels, entry in items:
+        lines.extend(histogram_lines(
+            'foodgram_http_request_db_queries', labels,
+            QUERY_BUCKETS, entry['queries'], entry['queries_sum']))
+    lines += [
+        '# HELP foodgram_http_request_db_seconds_total Time spent in SQL.',
+        '# TYPE foodgram_http_request_db_seconds_total counter',
+    ]
+    for labels, entry in items:
+        lines.append(f'foodgram_http_request_db_seconds_total{{{labels}}} '
+                     f'{entry["db_seconds"]}')
+    lines += [
+        '# HELP foodgram_http_response_bytes_total Size of response bodies.',
+        '# TYPE foodgram_http_response_bytes_total counter',
+    ]
+    for labels, entry in items:
+        lines.append(f'foodgram_http_response_bytes_total{{{labels}}} '
+                     f'{entry["bytes"]}')
+    return '\n'.join(lines) + '\n'
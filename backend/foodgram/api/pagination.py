@@ -0,0 +1,162 @@
+import base64
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from recipes.models import FeedEntry
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator keeping the objects count of a query in the cache,
+    so that COUNT(*) over the filtered join runs once in a while"""
+    count_timeout = 60
+
+    @cached_property
+    def count(self):
+        try:
+            sql, params = self.object_list.query.sql_with_params()
+        except (AttributeError, EmptyResultSet):
+            return super().count
+        key = 'count:{}'.format(
+            hashlib.md5(f'{sql}{params}'.encode()).hexdigest())
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, self.count_timeout)
+        return count
+
+
+class RecipePagination(PageNumberPagination):
+    """Page number pagination with an optional keyset (cursor) mode.
+    The mode is enabled by the "cursor" query parameter: recipes keep
+    the ordering of the queryset, (-pub_date, -id) by default, and
+    the next page starts right after the last recipe of the current one,
+    without COUNT(*) and OFFSET. Only orderings by "cursor_fields"
+    can be paged this way."""
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    django_paginator_class = CachedCountPaginator
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-pub_date', '-id')
+    cursor_fields = {
+        'pub_date': parse_datetime,
+        'id': int,
+        'favorites_count': int,
+    }
+    invalid_cursor_message = 'Неверный курсор.'
+    invalid_ordering_message = (
+        'Навигация по курсору не поддерживает такую сортировку.')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.ordering = self.get_cursor_ordering(queryset)
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(
+            request.query_params[self.cursor_query_param])
+        if position is not None:
+            queryset = queryset.filter(self.after_position(position))
+        results = list(queryset.order_by(*self.ordering)[:page_size + 1])
+        self.has_next_page = len(results) > page_size
+        self.cursor_page = results[:page_size]
+        return self.cursor_page
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_cursor_link()),
+            ('results', data)
+        ]))
+
+    def get_next_cursor_link(self):
+        if not self.has_next_page or not self.cursor_page:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.cursor_page[-1])
+        )
+
+    def get_cursor_ordering(self, queryset):
+        """Ordering of the queryset, rejected with 400 when it is not
+        made of "cursor_fields" only, e.g. the relevance of a search"""
+        ordering = tuple(queryset.query.order_by) or self.cursor_ordering
+        for field in ordering:
+            if (not isinstance(field, str)
+                    or field.lstrip('-') not in self.cursor_fields):
+                raise ValidationError(
+                    {self.cursor_query_param: self.invalid_ordering_message})
+        return ordering
+
+    def after_position(self, position):
+        """Condition of the recipes following the position in the ordering"""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def encode_cursor(self, recipe):
+        position = '|'.join(
+            value.isoformat() if isinstance(value, datetime) else str(value)
+            for value in (
+                getattr(recipe, field.lstrip('-')) for field in self.ordering)
+        )
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        """Returns the values of the ordering fields of the cursor
+        or None for the first page"""
+        if not cursor:
+            return None
+        try:
+            values = (
+                base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            )
+            if len(values) != len(self.ordering):
+                raise ValueError(cursor)
+            position = [
+                self.cursor_fields[field.lstrip('-')](value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+
+class FeedPagination(RecipePagination):
+    """Keyset pagination of the subscription feed, always in cursor mode.
+    Ids of a page are read from the user's timeline, the recipes
+    are then taken from the given queryset."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = True
+        self.request = request
+        self.ordering = self.cursor_ordering
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param))
+        ids = FeedEntry.objects.page(request.user, position, page_size + 1)
+        self.has_next_page = len(ids) > page_size
+        recipes = queryset.in_bulk(ids[:page_size])
+        self.cursor_page = [
+            recipes[pk] for pk in ids[:page_size] if pk in recipes]
+        return self.cursor_page
@@ -0,0 +1,19 @@
+from rest_framework.parsers import DataAndFiles, FileUploadParser
+
+
+class ImageUploadParser(FileUploadParser):
+    """Raw image in the request body (Content-Type: image/jpeg etc.).
+    The body is streamed through Django's upload handlers and
+    is passed on as the "image" file."""
+    media_type = 'image/*'
+
+    def get_filename(self, stream, media_type, parser_context):
+        filename = super().get_filename(stream, media_type, parser_context)
+        if filename:
+            return filename
+        subtype = media_type.split(';')[0].split('/')[-1].strip()
+        return f'image.{subtype}'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        files = super().parse(stream, media_type, parser_context).files
+        return DataAndFiles({}, {'image': files['file']})
@@ -0,0 +1,135 @@
+import abc
+import csv
+import io
+import json
+
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFont
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.renderers import BaseRenderer
+
+from .metrics import render_metrics
+
+
+class ShoppingListRenderer(BaseRenderer, metaclass=abc.ABCMeta):
+    """Base of the shopping list formats.
+    The list is produced chunk by chunk by "stream" from rows of
+    (name, total amount, measurement unit); "render" only serves
+    error responses of the download action, as plain text."""
+    charset = 'utf-8'
+    title = 'Cписок покупок:'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'text/plain; charset=utf-8'
+        if isinstance(data, dict) and 'detail' in data:
+            data = data['detail']
+        return str(data).encode('utf-8')
+
+    @abc.abstractmethod
+    def stream(self, ingredients):
+        """Iterable of the encoded chunks of the list"""
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        yield f'{self.title}\n'.encode(self.charset)
+        separator = ''
+        for ingredient in ingredients:
+            yield '{}{} - {} {}.'.format(
+                separator, *ingredient).encode(self.charset)
+            separator = '\n'
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('Ингредиент', 'Количество', 'Ед. измерения')
+
+    def stream(self, ingredients):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in (self.header, *ingredients):
+            writer.writerow(row)
+            yield buffer.getvalue().encode(self.charset)
+            buffer.seek(0)
+            buffer.truncate()
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, ingredients):
+        separator = '['
+        for name, amount, measurement_unit in ingredients:
+            yield (separator + json.dumps(
+                {'name': name,
+                 'amount': amount,
+                 'measurement_unit': measurement_unit},
+                ensure_ascii=False
+            )).encode(self.charset)
+            separator = ','
+        yield b']' if separator == ',' else b'[]'
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    """Simple PDF: the list drawn on A4 pages at 150 dpi.
+    Unlike the other formats it is built in memory and sent as one chunk.
+    The font, which must have Cyrillic glyphs, is taken from
+    the SHOPPING_LIST_PDF_FONT setting; without it the format
+    is not acceptable."""
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    page_size = (1240, 1754)
+    margin = 120
+    font_size = 32
+    line_height = 48
+    font_missing_message = 'Список покупок в PDF сейчас недоступен.'
+
+    def get_font(self):
+        try:
+            return ImageFont.truetype(
+                settings.SHOPPING_LIST_PDF_FONT, self.font_size)
+        except OSError:
+            raise NotAcceptable(self.font_missing_message)
+
+    def stream(self, ingredients):
+        # the font is loaded before the response starts, so that
+        # its absence is answered with 406
+        return self.pages(ingredients, self.get_font())
+
+    def pages(self, ingredients, font):
+        lines = [self.title, ''] + [
+            '{} - {} {}.'.format(*ingredient) for ingredient in ingredients]
+        per_page = (self.page_size[1] - 2 * self.margin) // self.line_height
+        pages = []
+        for start in range(0, len(lines), per_page):
+            page = Image.new('RGB', self.page_size, 'white')
+            draw = ImageDraw.Draw(page)
+            for number, line in enumerate(lines[start:start + per_page]):
+                draw.text(
+                    (self.margin, self.margin + number * self.line_height),
+                    line, fill='black', font=font)
+            pages.append(page)
+        buffer = io.BytesIO()
+        pages[0].save(buffer, format='PDF', save_all=True,
+                      append_images=pages[1:], resolution=150.0)
+        yield buffer.getvalue()
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Request metrics in the Prometheus text format"""
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and 'detail' in data:
+            return str(data['detail']).encode(self.charset)
+        return render_metrics(data).encode(self.charset)
@@ -0,0 +1,56 @@
+import threading
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+
+from .cache import catalog_version_key, get_versions
+
+_search_lock = threading.Lock()
+_ingredient_search = {}
+
+
+class IngredientSearch:
+    """In-memory index of ingredients for autocomplete.
+    Names are case-folded and sorted, so prefix matches are found
+    by binary search; substring matches are ranked after them
+    by the position of the match."""
+
+    def __init__(self, ingredients):
+        self.ingredients = sorted(
+            ingredients,
+            key=lambda ingredient: (ingredient['name'].casefold(),
+                                    ingredient['id'])
+        )
+        self.names = [
+            ingredient['name'].casefold() for ingredient in self.ingredients
+        ]
+
+    def search(self, query, limit=None):
+        query = query.casefold()
+        start = bisect_left(self.names, query)
+        end = bisect_left(self.names, query + '\U0010ffff', lo=start)
+        found = self.ingredients[start:end]
+        if limit is not None and len(found) >= limit:
+            return found[:limit]
+        substring_matches = sorted(
+            (name.find(query), position)
+            for position, name in enumerate(self.names)
+            if name.find(query) > 0
+        )
+        found.extend(
+            self.ingredients[position] for _, position in substring_matches)
+        return found if limit is None else found[:limit]
+
+
+def get_ingredient_search():
+    """Returns the index of ingredients, rebuilt when the catalog changes"""
+    key = catalog_version_key('ingredients')
+    version = get_versions([key])[key]
+    with _search_lock:
+        if _ingredient_search.get('version') == version:
+            return _ingredient_search['index']
+    index = IngredientSearch(
+        Ingredient.objects.values('id', 'name', 'measurement_unit'))
+    with _search_lock:
+        _ingredient_search.update(version=version, index=index)
+    return index
@@ -1,29 +1,61 @@
+import json
+import re
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
 from drf_base64.fields import Base64ImageField
+from recipes.background import run_in_background
+from recipes.images import rendition_urls, save_upload, select_image_size
 from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
-                            RecipeIngredient,
-                            ShoppingCart, Tag)
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag)
+from recipes.tasks import fan_out_recipes, process_recipe_image
 from rest_framework import serializers
 
-from users.models import Follow, User
-from users.serializers import UserGetSerializer
+from users.models import User
+from users.serializers import (AuthorSerializer, SubscribedMixin,
+                               UserGetSerializer)
+
+
+class RecipeImagesMixin:
+    """"images" field method with URLs of the image renditions.
+    ?image_size= points "image" to the rendition of that size."""
+
+    def get_images(self, obj):
+        return rendition_urls(obj.image, self.context.get('request'))
+
+    def to_representation(self, instance):
+        return select_image_size(super().to_representation(instance),
+                                 self.context.get('request'))
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(RecipeImagesMixin, serializers.ModelSerializer):
     """GET-method: Recipes list."""
     image = Base64ImageField(read_only=True)
+    images = serializers.SerializerMethodField()
     name = serializers.ReadOnlyField()
     cooking_time = serializers.ReadOnlyField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class AuthorRecipesMixin:
+    """"recipes" field method for followed authors. Recipes are read
+    from "recipe_previews", see users.views.with_recipe_previews."""
+
+    def get_recipes(self, obj):
+        return RecipeSerializer(obj.recipe_previews, many=True,
+                                read_only=True, context=self.context).data
+
+
+class FollowSerializer(AuthorRecipesMixin, SubscribedMixin,
+                       serializers.ModelSerializer):
     """GET-method: Following authors list."""
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -35,32 +67,19 @@ class FollowSerializer(serializers.ModelSerializer):
             'last_name',
             'is_subscribed',
             'recipes',
-            'recipes_count'
+            'recipes_count',
+            'followers_count',
+            'following_count'
         )
 
-    def get_is_subscribed(self, obj):
-        return (self.context.get('request').user.is_authenticated
-                and Follow.objects.filter(user=self.context['request'].user,
-                                          author=obj).exists())
-
-    @staticmethod
-    def get_recipes(obj):
-        recipes = obj.recipes.all()
-        serializer = RecipeSerializer(recipes, many=True, read_only=True)
-        return serializer.data
 
-    @staticmethod
-    def get_recipes_count(obj):
-        return obj.recipes.count()
-
-
-class FollowAuthorSerializer(serializers.ModelSerializer):
+class FollowAuthorSerializer(AuthorRecipesMixin, SubscribedMixin,
+                             serializers.ModelSerializer):
     """POST, DELETE-methods: Create or delete a subscription."""
     email = serializers.ReadOnlyField()
     username = serializers.ReadOnlyField()
     is_subscribed = serializers.SerializerMethodField()
-    recipes = RecipeSerializer(many=True, read_only=True)
-    recipes_count = serializers.SerializerMethodField()
+    recipes = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -72,7 +91,9 @@ class FollowAuthorSerializer(serializers.ModelSerializer):
             'last_name',
             'is_subscribed',
             'recipes',
-            'recipes_count'
+            'recipes_count',
+            'followers_count',
+            'following_count'
         )
 
     def validate(self, obj):
@@ -81,14 +102,6 @@ class FollowAuthorSerializer(serializers.ModelSerializer):
                 {'errors': 'Нельзя подписаться на себя.'})
         return obj
 
-    @staticmethod
-    def get_is_subscribed(obj):
-        return FollowSerializer.get_is_subscribed(FollowSerializer(), obj)
-
-    @staticmethod
-    def get_recipes_count(obj):
-        return obj.recipes.count()
-
 
 class TagSerializer(serializers.ModelSerializer):
     """GET-method: Tags list"""
@@ -127,9 +140,92 @@ class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeGetSerializer(serializers.ModelSerializer):
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    """GET-method: Ingredients totals in the shopping cart"""
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit')
+    amount = serializers.ReadOnlyField(source='total_amount')
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Many-to-many relation resolving all primary keys with one query"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        pks = []
+        for pk in data:
+            try:
+                pks.append(int(pk))
+            except (TypeError, ValueError):
+                child.fail('incorrect_type', data_type=type(pk).__name__)
+        objects = child.get_queryset().in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
+class ImageUploadField(serializers.Field):
+    """Image as a base64 string or as an uploaded file (multipart or
+    raw body), only checked for its size and type in the request.
+    It is decoded and processed by the image worker, "to_internal_value"
+    returns the base64 payload or the uploaded file."""
+    default_error_messages = {
+        'invalid': 'Загрузите изображение файлом или в кодировке base64.',
+        'format': 'Формат изображения не поддерживается: {format}.',
+        'max_size': 'Размер изображения не должен превышать {max_size} МБ.',
+    }
+    data_url = re.compile(r'^data:image/(?P<format>[\w.+-]+);base64,')
+    formats = ('png', 'jpeg', 'jpg', 'gif', 'webp')
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            return self.file_to_internal_value(data)
+        if not isinstance(data, str):
+            self.fail('invalid')
+        match = self.data_url.match(data)
+        if match:
+            self.check_format(match.group('format'))
+            data = data[match.end():]
+        if not data:
+            self.fail('invalid')
+        self.check_size(len(data) * 3 // 4)
+        return data
+
+    def file_to_internal_value(self, file):
+        content_type = (file.content_type or '').split(';')[0].strip()
+        if not content_type.startswith('image/'):
+            self.fail('format', format=content_type or file.name)
+        self.check_format(content_type[len('image/'):])
+        self.check_size(file.size)
+        return file
+
+    def check_format(self, image_format):
+        if image_format.lower() not in self.formats:
+            self.fail('format', format=image_format)
+
+    def check_size(self, size):
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail('max_size',
+                      max_size=settings.RECIPE_IMAGE_MAX_SIZE // 2 ** 20)
+
+    def to_representation(self, value):
+        return value.url if value else None
+
+
+class RecipeGetSerializer(RecipeImagesMixin, serializers.ModelSerializer):
     """GET-method: Recipes list"""
-    author = UserGetSerializer(read_only=True)
+    author = AuthorSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     ingredients = RecipeIngredientSerializer(
         many=True,
@@ -139,35 +235,55 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'image_state',
+                  'images', 'text', 'cooking_time')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._user_flags = {}
+
+    def get_user_flag(self, obj, flag, model):
+        """Reads the flag annotated by "RecipeQuerySet.with_user_flags"
+        or looks it up in one query for all the serialized recipes"""
+        if hasattr(obj, flag):
+            return getattr(obj, flag)
+        user = self.context.get('request').user
+        if not user.is_authenticated:
+            return False
+        if obj.pk not in self._user_flags.get(flag, ((), ()))[0]:
+            recipes = (self.parent.instance
+                       if isinstance(self.parent, serializers.ListSerializer)
+                       else [obj])
+            recipes_ids = {recipe.pk for recipe in recipes}
+            self._user_flags[flag] = (
+                recipes_ids,
+                set(model.objects.filter(
+                    user=user,
+                    recipe__in=recipes_ids).values_list('recipe', flat=True))
+            )
+        return obj.pk in self._user_flags[flag][1]
 
     def get_is_favorited(self, obj):
-        return (self.context.get('request').user.is_authenticated
-                and FavoriteRecipe.objects.filter(
-                    user=self.context.get('request').user,
-                    recipe=obj).exists())
+        return self.get_user_flag(obj, 'is_favorited', FavoriteRecipe)
 
     def get_is_in_shopping_cart(self, obj):
-        return (self.context.get('request').user.is_authenticated
-                and ShoppingCart.objects.filter(
-                    user=self.context.get('request').user,
-                    recipe=obj).exists())
+        return self.get_user_flag(obj, 'is_in_shopping_cart', ShoppingCart)
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """POST, PATCH, DELETE-methods for recipes"""
     id = serializers.ReadOnlyField()
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
+    tags = BulkManyRelatedField(
+        child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=Tag.objects.all())
     )
     author = UserGetSerializer(read_only=True)
-    image = Base64ImageField()
+    image = ImageUploadField()
     ingredients = RecipeIngredientCreateSerializer(many=True)
 
     class Meta:
@@ -179,18 +295,62 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         required_fields = ('ingredients', 'tags', 'image', 'name',
                            'text', 'cooking_time')
         for field in required_fields:
+            if self.partial and field not in value:
+                continue
             if not value.get(field):
                 raise serializers.ValidationError(
                     f'Поле {field} обязательно для заполнения.'
                 )
+        if 'ingredients' not in value:
+            return value
         ingredients_ids = [obj['id'] for obj in value.get('ingredients')]
         unique_ingredients_ids = set(ingredients_ids)
         if len(unique_ingredients_ids) != len(ingredients_ids):
             raise serializers.ValidationError(
                 'Ингредиенты не могут повторяться'
             )
+        ingredients = Ingredient.objects.in_bulk(ingredients_ids)
+        missing_ids = [pk for pk in ingredients_ids if pk not in ingredients]
+        if missing_ids:
+            raise serializers.ValidationError({
+                'ingredients': 'Ингредиенты не найдены: {}.'.format(
+                    ', '.join(map(str, missing_ids)))
+            })
+        for ingredient in value['ingredients']:
+            ingredient['ingredient'] = ingredients[ingredient['id']]
         return value
 
+    def to_internal_value(self, data):
+        if hasattr(data, 'getlist'):
+            data = self.form_data(data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def form_data(data):
+        """Fields of a multipart/form-data request: "tags" are repeated,
+        "ingredients" is a JSON list and "image" is a file part"""
+        values = {
+            key: data[key] for key in data
+            if key not in ('tags', 'ingredients')
+        }
+        if 'tags' in data:
+            values['tags'] = data.getlist('tags')
+        if 'ingredients' in data:
+            try:
+                values['ingredients'] = json.loads(data['ingredients'])
+            except ValueError:
+                raise serializers.ValidationError({
+                    'ingredients': 'Ингредиенты ожидаются списком в JSON.'
+                })
+        return values
+
+    @staticmethod
+    def save_image_upload(image):
+        if isinstance(image, str):
+            return save_upload(image.encode('ascii'), 'b64')
+        extension = image.content_type.split(';')[0].split('/')[-1].strip()
+        return save_upload(image, extension.lower())
+
     @staticmethod
     def tags_set(recipe, tags):
         recipe.tags.set(tags)
@@ -200,37 +360,94 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         RecipeIngredient.objects.bulk_create(
             [RecipeIngredient(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(pk=ingredient['id']),
+                ingredient=ingredient['ingredient'],
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        upload_name = self.save_image_upload(validated_data.pop('image'))
         recipe = Recipe.objects.create(
             author=self.context.get('request').user,
+            image_upload=upload_name,
+            image_state=Recipe.IMAGE_PROCESSING,
             **validated_data
         )
         self.tags_set(recipe, tags)
         self.ingredients_set(recipe, ingredients)
+        run_in_background(process_recipe_image, recipe.pk, upload_name)
+        run_in_background(fan_out_recipes, [recipe.pk])
         return recipe
 
+    @classmethod
+    def ingredients_update(cls, recipe, ingredients):
+        """Updates changed amounts, inserts new and deletes removed
+        ingredients of the recipe. Returns old and new amounts."""
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient
+            in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            pk: recipe_ingredient.amount
+            for pk, recipe_ingredient in current.items()
+        }
+        new_amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed_ids = [pk for pk in current if pk not in new_amounts]
+        if removed_ids:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient__in=removed_ids).delete()
+        changed = [
+            recipe_ingredient
+            for pk, recipe_ingredient in current.items()
+            if new_amounts.get(pk, recipe_ingredient.amount)
+            != recipe_ingredient.amount
+        ]
+        for recipe_ingredient in changed:
+            recipe_ingredient.amount = new_amounts[
+                recipe_ingredient.ingredient_id]
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        cls.ingredients_set(
+            recipe,
+            [ingredient for ingredient in ingredients
+             if ingredient['id'] not in current]
+        )
+        return old_amounts, new_amounts
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
-        instance.image = validated_data.get('image', instance.image)
+        if 'image' in validated_data:
+            instance.image_upload = self.save_image_upload(
+                validated_data['image'])
+            instance.image_state = Recipe.IMAGE_PROCESSING
         instance.cooking_time = validated_data.get(
             'cooking_time', instance.cooking_time)
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        RecipeIngredient.objects.filter(
-            recipe=instance,
-            ingredient__in=instance.ingredients.all()).delete()
-        self.tags_set(instance, tags)
-        self.ingredients_set(instance, ingredients)
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if tags is not None:
+            self.tags_set(instance, tags)
+        if ingredients is not None:
+            ShoppingListItem.objects.update_recipe(
+                instance, *self.ingredients_update(instance, ingredients))
         instance.save()
+        if 'image' in validated_data:
+            run_in_background(
+                process_recipe_image, instance.pk, instance.image_upload)
         return instance
 
     def to_representation(self, instance):
+        instance = (
+            Recipe.objects.with_related()
+            .with_user_flags(self.context.get('request').user)
+            .get(pk=instance.pk)
+        )
         return RecipeGetSerializer(instance, context=self.context).data
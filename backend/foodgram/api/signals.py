@@ -0,0 +1,208 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag)
+from recipes.signals import ingredients_loaded
+
+from users.models import Follow, User
+from .cache import (RECIPES_VERSION_KEY, author_version_key, bump_version,
+                    catalog_version_key, recipe_version_key,
+                    shopping_cart_version_key)
+
+AUTHOR_PAYLOAD_FIELDS = ('email', 'username', 'first_name', 'last_name')
+RECIPE_COUNTERS = {
+    FavoriteRecipe: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    bump_version(recipe_version_key(instance.pk))
+    if kwargs.get('created'):
+        return
+    carts = ShoppingCart.objects.filter(recipe_id=instance.pk)
+    for user_id in carts.values_list('user_id', flat=True):
+        bump_version(shopping_cart_version_key(user_id))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_search_vector(sender, instance, update_fields, **kwargs):
+    if update_fields is not None and not {'name', 'text'} & update_fields:
+        return
+    Recipe.objects.filter(pk=instance.pk).update_search_vector()
+
+
+@receiver(post_save, sender=Recipe)
+def author_recipe_created(sender, instance, created, **kwargs):
+    if created:
+        User.objects.filter(pk=instance.author_id).change_counter(
+            'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def author_recipe_deleted(sender, instance, **kwargs):
+    User.objects.filter(pk=instance.author_id).change_counter(
+        'recipes_count', -1)
+
+
+def change_follow_counters(user_id, author_id, delta):
+    User.objects.filter(pk=user_id).change_counter('following_count', delta)
+    User.objects.filter(pk=author_id).change_counter(
+        'followers_count', delta)
+
+
+@receiver(pre_save, sender=Follow)
+def follow_saving(sender, instance, **kwargs):
+    instance.previous_pair = None
+    if instance.pk is not None:
+        instance.previous_pair = Follow.objects.filter(
+            pk=instance.pk).values_list('user', 'author').first()
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, **kwargs):
+    """Follow counters are kept in step for follows changed
+    by the API, the admin or any other code"""
+    pair = (instance.user_id, instance.author_id)
+    if instance.previous_pair == pair:
+        return
+    if instance.previous_pair is not None:
+        change_follow_counters(*instance.previous_pair, -1)
+    change_follow_counters(*pair, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    change_follow_counters(instance.user_id, instance.author_id, -1)
+
+
+@receiver(pre_save, sender=FavoriteRecipe)
+@receiver(pre_save, sender=ShoppingCart)
+def recipe_mark_saving(sender, instance, **kwargs):
+    instance.previous_recipe_id = None
+    if instance.pk is not None:
+        instance.previous_recipe_id = sender.objects.filter(
+            pk=instance.pk).values_list('recipe', flat=True).first()
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_mark_saved(sender, instance, **kwargs):
+    """Favorites and carts counters are kept in step for rows changed
+    by the API, the admin or any other code"""
+    if instance.previous_recipe_id == instance.recipe_id:
+        return
+    field = RECIPE_COUNTERS[sender]
+    if instance.previous_recipe_id is not None:
+        Recipe.objects.filter(
+            pk=instance.previous_recipe_id).change_counter(field, -1)
+    Recipe.objects.filter(pk=instance.recipe_id).change_counter(field, 1)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_mark_deleted(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).change_counter(
+        RECIPE_COUNTERS[sender], -1)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    bump_version(recipe_version_key(instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_version(recipe_version_key(instance.pk))
+    elif pk_set:
+        for pk in pk_set:
+            bump_version(recipe_version_key(pk))
+    else:
+        bump_version(RECIPES_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def recipes_catalog_changed(sender, **kwargs):
+    """Tags and ingredients are shared by many recipe payloads"""
+    if kwargs.get('created'):
+        return
+    bump_version(RECIPES_VERSION_KEY)
+
+
+@receiver(pre_save, sender=User)
+def author_saving(sender, instance, update_fields, **kwargs):
+    """Compares the fields shown in recipe payloads with the saved ones,
+    so that logins and password changes keep the payloads"""
+    instance.author_payload_changed = False
+    if instance.pk is None or (
+            update_fields is not None
+            and not set(AUTHOR_PAYLOAD_FIELDS) & set(update_fields)):
+        return
+    saved = User.objects.filter(pk=instance.pk).values(
+        *AUTHOR_PAYLOAD_FIELDS).first()
+    instance.author_payload_changed = saved is not None and any(
+        saved[field] != getattr(instance, field)
+        for field in AUTHOR_PAYLOAD_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, **kwargs):
+    if getattr(instance, 'author_payload_changed', False):
+        bump_version(author_version_key(instance.pk))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_catalog_changed(sender, **kwargs):
+    bump_version(catalog_version_key('tags'))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver(ingredients_loaded)
+def ingredients_catalog_changed(sender, **kwargs):
+    bump_version(catalog_version_key('ingredients'))
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    bump_version(shopping_cart_version_key(instance.user_id))
+
+
+@receiver(pre_save, sender=ShoppingCart)
+def cart_saving(sender, instance, **kwargs):
+    instance.previous_user_id = None
+    if instance.pk is not None:
+        instance.previous_user_id = ShoppingCart.objects.filter(
+            pk=instance.pk).values_list('user', flat=True).first()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def cart_saved(sender, instance, created, **kwargs):
+    """Keeps the shopping list totals in step with carts changed
+    by the API, the admin or any other code"""
+    if created:
+        ShoppingListItem.objects.add_recipe(instance.user, instance.recipe)
+        return
+    ShoppingListItem.objects.rebuild(
+        {instance.user_id, instance.previous_user_id} - {None})
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def cart_deleting(sender, instance, **kwargs):
+    """Reads the recipe amounts before anything is deleted:
+    in a cascade the recipe ingredients may go before the cart"""
+    instance.recipe_amounts = ShoppingListItem.objects.recipe_amounts(
+        instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def cart_deleted(sender, instance, **kwargs):
+    ShoppingListItem.objects.remove_amounts(
+        instance.user_id, instance.recipe_amounts)
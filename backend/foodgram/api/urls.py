@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (IngredientViewSet, RecipeViewSet, TagViewSet)
+from .views import (IngredientViewSet, MetricsView, RecipeViewSet,
+                    TagViewSet)
 
 router_v1 = DefaultRouter()
 
@@ -11,5 +12,6 @@ router_v1.register(r'recipes', RecipeViewSet, basename='recipes')
 router_v1.register(r'tags', TagViewSet, basename='tags')
 
 urlpatterns = [
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('', include(router_v1.urls)),
 ]
@@ -1,22 +1,38 @@
 from http import HTTPStatus
 
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.db import transaction
+from django.http import (HttpResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
-from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
-                            RecipeIngredient, ShoppingCart, Tag)
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
 from rest_framework import filters, mixins, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .filters import IngredientFilter, RecipeFilter
+from .cache import (cache_stream, get_catalog_content, get_catalog_etag,
+                    get_recipes_data, get_shopping_cart_key,
+                    set_catalog_content)
+from .filters import IngredientFilter, RecipeFilter, RecipeOrderingFilter
+from .metrics import registry
+from .pagination import FeedPagination, RecipePagination
+from .parsers import ImageUploadParser
 from .permissions import IsAuthorOrReadOnly
+from .renderers import (PrometheusRenderer, ShoppingListCSVRenderer,
+                        ShoppingListJSONRenderer, ShoppingListPDFRenderer,
+                        ShoppingListTextRenderer)
+from .search import get_ingredient_search
 from .serializers import (IngredientSerializer, RecipeCreateSerializer,
                           RecipeGetSerializer, RecipeSerializer,
-                          TagSerializer)
+                          ShoppingListItemSerializer, TagSerializer)
 
 
 class ListRetrieveModelMixin(mixins.ListModelMixin,
@@ -24,35 +40,119 @@ class ListRetrieveModelMixin(mixins.ListModelMixin,
     pass
 
 
-class TagViewSet(ListRetrieveModelMixin,
+class CatalogConditionalMixin:
+    """Conditional GET for rarely changing catalogs.
+    Responses carry a strong ETag derived from the catalog version
+    and the rendered media type, a matching If-None-Match gets 304
+    and rendered JSON is kept in process until the catalog changes."""
+    catalog = None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_catalog_response(super().list, request,
+                                         *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_catalog_response(super().retrieve, request,
+                                         *args, **kwargs)
+
+    def get_catalog_response(self, view_method, request, *args, **kwargs):
+        etag = get_catalog_etag(self.catalog, request.get_full_path(),
+                                request.accepted_media_type)
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        if not isinstance(request.accepted_renderer, JSONRenderer):
+            response = view_method(request, *args, **kwargs)
+        else:
+            content = get_catalog_content(etag)
+            if content is None:
+                response = view_method(request, *args, **kwargs)
+                if response.status_code != HTTPStatus.OK:
+                    return response
+                content = JSONRenderer().render(response.data)
+                set_catalog_content(etag, content)
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
+class TagViewSet(CatalogConditionalMixin,
+                 ListRetrieveModelMixin,
                  viewsets.GenericViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    catalog = 'tags'
 
 
-class IngredientViewSet(ListRetrieveModelMixin,
+class IngredientViewSet(CatalogConditionalMixin,
+                        ListRetrieveModelMixin,
                         viewsets.GenericViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
     filterset_class = IngredientFilter
+    catalog = 'ingredients'
+
+    def filter_queryset(self, queryset):
+        """Searches by "name" in the in-memory index of ingredients:
+        prefix matches first, then substring ones"""
+        name = self.request.query_params.get('name')
+        if self.action != 'list' or name is None:
+            return super().filter_queryset(queryset)
+        limit = self.request.query_params.get('limit')
+        return get_ingredient_search().search(
+            name, int(limit) if limit and limit.isdigit() else None)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
-    pagination_class = PageNumberPagination
+    pagination_class = RecipePagination
     permission_classes = (IsAuthorOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('favorites_count',)
+
+    def get_queryset(self):
+        return Recipe.objects.with_user_flags(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(
+                get_recipes_data(queryset, self.get_serializer_context()))
+        return self.get_paginated_response(
+            get_recipes_data(page, self.get_serializer_context()))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(get_recipes_data(
+            [self.get_object()], self.get_serializer_context())[0])
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'feed'):
             return RecipeGetSerializer
         return RecipeCreateSerializer
 
+    @action(detail=True, methods=['put'],
+            parser_classes=(ImageUploadParser, MultiPartParser, JSONParser))
+    def image(self, request, **kwargs):
+        """Replaces the recipe image: a raw image body, an "image"
+        file part or base64 "image" in JSON. The image is processed
+        in the background, the recipe is returned right away."""
+        serializer = RecipeCreateSerializer(
+            self.get_object(),
+            data={'image': request.data.get('image')},
+            partial=True,
+            context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=HTTPStatus.ACCEPTED)
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(IsAuthenticated,))
     def favorite(self, request, **kwargs):
@@ -63,15 +163,19 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.is_valid(raise_exception=True)
             if not FavoriteRecipe.objects.filter(user=request.user,
                                                  recipe=recipe).exists():
-                FavoriteRecipe.objects.create(user=request.user, recipe=recipe)
+                with transaction.atomic():
+                    FavoriteRecipe.objects.create(user=request.user,
+                                                  recipe=recipe)
                 return Response(serializer.data,
                                 status=HTTPStatus.CREATED)
             return Response({'errors': 'Рецепт уже в избранном.'},
                             status=HTTPStatus.BAD_REQUEST)
 
         if request.method == 'DELETE':
-            get_object_or_404(FavoriteRecipe, user=request.user,
-                              recipe=recipe).delete()
+            favorite = get_object_or_404(FavoriteRecipe, user=request.user,
+                                         recipe=recipe)
+            with transaction.atomic():
+                favorite.delete()
             return Response({'detail': 'Рецепт успешно удален из избранного.'},
                             status=HTTPStatus.NO_CONTENT)
 
@@ -87,37 +191,86 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.is_valid(raise_exception=True)
             if not ShoppingCart.objects.filter(user=request.user,
                                                recipe=recipe).exists():
-                ShoppingCart.objects.create(user=request.user, recipe=recipe)
+                with transaction.atomic():
+                    ShoppingCart.objects.create(user=request.user,
+                                                recipe=recipe)
                 return Response(serializer.data,
                                 status=HTTPStatus.CREATED)
             return Response({'errors': 'Рецепт уже в списке покупок.'},
                             status=HTTPStatus.BAD_REQUEST)
 
         if request.method == 'DELETE':
-            get_object_or_404(ShoppingCart, user=request.user,
-                              recipe=recipe).delete()
+            cart = get_object_or_404(ShoppingCart, user=request.user,
+                                     recipe=recipe)
+            with transaction.atomic():
+                cart.delete()
             return Response(
                 {'detail': 'Рецепт успешно удален из списка покупок.'},
                 status=HTTPStatus.NO_CONTENT
             )
 
     @action(detail=False, methods=['get'],
-            permission_classes=(IsAuthenticated,))
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=(ShoppingListTextRenderer,
+                              ShoppingListCSVRenderer,
+                              ShoppingListJSONRenderer,
+                              ShoppingListPDFRenderer))
     def download_shopping_cart(self, request, **kwargs):
-        ingredients = (
-            RecipeIngredient.objects
-            .filter(recipe__recipe_in_cart__user=request.user)
-            .values('ingredient')
-            .annotate(total_amount=Sum('amount'))
-            .values_list('ingredient__name', 'total_amount',
-                         'ingredient__measurement_unit')
-        )
-        file_list = []
-        [file_list.append(
-            '{} - {} {}.'.format(*ingredient)) for ingredient in ingredients]
-        file = HttpResponse('Cписок покупок:\n' + '\n'.join(file_list),
-                            content_type='text/plain')
+        """Shopping list in the format chosen by ?format=
+        (txt, csv, json or pdf). A rendered list is cached
+        until the user's cart or its recipes change."""
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        key = get_shopping_cart_key(request.user, renderer.format)
+        content = cache.get(key)
+        if content is not None:
+            file = HttpResponse(content, content_type=content_type)
+        else:
+            ingredients = (
+                ShoppingListItem.objects
+                .filter(user=request.user)
+                .values_list('ingredient__name', 'total_amount',
+                             'ingredient__measurement_unit')
+                .order_by('ingredient__name')
+            )
+            file = StreamingHttpResponse(
+                cache_stream(key, renderer.stream(ingredients.iterator())),
+                content_type=content_type
+            )
         file['Content-Disposition'] = (
-            'attachment; filename=Shopping_cart.txt'
+            f'attachment; filename=Shopping_cart.{renderer.format}'
         )
         return file
+
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,),
+            pagination_class=FeedPagination)
+    def feed(self, request, **kwargs):
+        """Recipes of the followed authors, newest first,
+        paginated by the "cursor" of the "next" link"""
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response(
+            get_recipes_data(page, self.get_serializer_context()))
+
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_summary(self, request, **kwargs):
+        """Live ingredients totals of the user's shopping cart"""
+        items = (
+            ShoppingListItem.objects
+            .filter(user=request.user)
+            .select_related('ingredient')
+            .order_by('ingredient__name')
+        )
+        return Response(ShoppingListItemSerializer(items, many=True).data)
+
+
+class MetricsView(APIView):
+    """Request metrics of all workers for Prometheus, staff only"""
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(registry.collect())
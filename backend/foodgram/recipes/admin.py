@@ -1,7 +1,12 @@
+from functools import partial
+
 from django.contrib import admin
+from django.db import transaction
 
 from .models import (FavoriteRecipe, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
+from .background import run_in_background
+from .tasks import delete_unused_image, fan_out_recipes, queue_recipe_image
 
 
 if not hasattr(admin, 'display'):
@@ -31,20 +36,50 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'times_favorited')
-    readonly_fields = ('times_favorited',)
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count',
+                    'image_state')
+    readonly_fields = ('favorites_count', 'in_carts_count', 'image_state')
+    exclude = ('image_upload',)
     list_filter = ('author', 'name', 'tags')
     empty_value_display = '-empty-'
 
-    @admin.display(description='Кол-во добавлений в избранное')
-    def times_favorited(self, obj):
-        return obj.favorite_recipe.count()
+    def save_model(self, request, obj, form, change):
+        previous = None
+        if change and 'image' in form.changed_data:
+            previous = Recipe.objects.filter(
+                pk=obj.pk).values_list('image', flat=True).first()
+        super().save_model(request, obj, form, change)
+        if not change:
+            run_in_background(fan_out_recipes, [obj.pk])
+        if 'image' in form.changed_data and obj.image:
+            queue_recipe_image(obj, obj.image.name)
+        if previous:
+            transaction.on_commit(partial(delete_unused_image, previous))
 
 
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
+    """Edits of recipe ingredients recompute the shopping lists
+    of the carts holding the recipes"""
     list_display = ('recipe', 'ingredient', 'amount')
 
+    def save_model(self, request, obj, form, change):
+        recipes = {obj.recipe_id}
+        if change:
+            recipes.update(RecipeIngredient.objects.filter(
+                pk=obj.pk).values_list('recipe', flat=True))
+        super().save_model(request, obj, form, change)
+        ShoppingListItem.objects.rebuild_carts(recipes)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ShoppingListItem.objects.rebuild_carts([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipes = set(queryset.values_list('recipe', flat=True))
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.objects.rebuild_carts(recipes)
+
 
 @admin.register(FavoriteRecipe)
 class FavoriteRcipeAdmin(admin.ModelAdmin):
@@ -54,3 +89,8 @@ class FavoriteRcipeAdmin(admin.ModelAdmin):
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'total_amount')
@@ -0,0 +1,44 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Thread pool of the process, created on first use (after fork)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS,
+                thread_name_prefix='background')
+        return _executor
+
+
+def run_task(func, *args, **kwargs):
+    """Runs the task in a pool thread. Errors are only logged and
+    the database connections of the thread are closed afterwards."""
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', func.__name__)
+    finally:
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """Runs func(*args, **kwargs) off the request.
+    BACKGROUND_TASKS = 'thread': in the thread pool once the current
+    transaction is committed; 'sync': right away, in place (tests)."""
+    if settings.BACKGROUND_TASKS == 'sync':
+        func(*args, **kwargs)
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(run_task, func, *args, **kwargs))
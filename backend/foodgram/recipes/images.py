@@ -0,0 +1,149 @@
+import base64
+import io
+import posixpath
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+RENDITION_SIZES = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+RENDITION_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+RENDITION_QUALITY = 82
+IMAGE_QUALITY = 90
+IMAGE_FORMATS = ('PNG', 'JPEG', 'GIF', 'WEBP')
+IMAGE_DIRECTORY = 'recipes'
+UPLOAD_DIRECTORY = 'recipes/uploads'
+
+
+def rendition_name(name, size, extension):
+    """recipes/<stem>.png -> recipes/renditions/<stem>_<size>.<extension>"""
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(
+        directory, 'renditions', f'{stem}_{size}.{extension}')
+
+
+def rendition_names(name):
+    return [
+        rendition_name(name, size, extension)
+        for size in RENDITION_SIZES for extension in RENDITION_FORMATS
+    ]
+
+
+def to_rgb(image):
+    """JPEG has no alpha channel: transparent images go on white"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def save_renditions(source, name, storage=default_storage):
+    """Saves resized copies of the image in every size and format.
+    Images are only shrunk, so "full" of a small image keeps its size."""
+    source = to_rgb(source)
+    for size, max_side in RENDITION_SIZES.items():
+        image = source.copy()
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        for extension, image_format in RENDITION_FORMATS.items():
+            buffer = io.BytesIO()
+            image.save(buffer, image_format, quality=RENDITION_QUALITY)
+            path = rendition_name(name, size, extension)
+            if storage.exists(path):
+                storage.delete(path)
+            storage.save(path, ContentFile(buffer.getvalue()))
+
+
+def generate_renditions(name, storage=default_storage):
+    """Saves renditions of the stored image"""
+    with storage.open(name) as file:
+        source = Image.open(file)
+        source.load()
+    save_renditions(source, name, storage)
+
+
+def delete_image(name, storage=default_storage):
+    """Deletes the stored image with its renditions"""
+    for path in (name, *rendition_names(name)):
+        if storage.exists(path):
+            storage.delete(path)
+
+
+def save_upload(content, extension, storage=default_storage):
+    """Stores raw uploaded content (bytes or an uploaded file,
+    which is copied chunk by chunk) for the image worker"""
+    if isinstance(content, bytes):
+        content = ContentFile(content)
+    return storage.save(
+        posixpath.join(UPLOAD_DIRECTORY, f'{uuid.uuid4()}.{extension}'),
+        content)
+
+
+def open_upload(name, storage=default_storage):
+    """Decodes and validates an upload saved by "save_upload".
+    Raises ValueError (or OSError) when it is not an allowed image."""
+    with storage.open(name) as file:
+        content = file.read()
+    if name.endswith('.b64'):
+        content = base64.b64decode(content, validate=True)
+    image = Image.open(io.BytesIO(content))
+    if image.format not in IMAGE_FORMATS:
+        raise ValueError(f'unsupported image format {image.format}')
+    width, height = image.size
+    if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+        raise ValueError(f'image is too large: {width}x{height}')
+    image.verify()
+    image = Image.open(io.BytesIO(content))
+    image.load()
+    return ImageOps.exif_transpose(image)
+
+
+def save_image(image, storage=default_storage):
+    """Re-encodes the image without its metadata: images with
+    transparency as PNG, the rest as JPEG. Returns the stored name."""
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image, image_format, extension = image.convert('RGBA'), 'PNG', 'png'
+    else:
+        image, image_format, extension = image.convert('RGB'), 'JPEG', 'jpg'
+    image.info.clear()
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=IMAGE_QUALITY, optimize=True)
+    return storage.save(
+        posixpath.join(IMAGE_DIRECTORY, f'{uuid.uuid4()}.{extension}'),
+        ContentFile(buffer.getvalue()))
+
+
+def rendition_urls(image, request=None, storage=default_storage):
+    """Returns {size: {format: url}} of the image renditions"""
+    if not image:
+        return None
+    urls = {}
+    for size in RENDITION_SIZES:
+        urls[size] = {}
+        for extension in RENDITION_FORMATS:
+            url = storage.url(rendition_name(image.name, size, extension))
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[size][extension] = url
+    return urls
+
+
+def select_image_size(data, request):
+    """Points "image" of a recipe payload to the JPEG rendition
+    requested by ?image_size="""
+    size = request.query_params.get('image_size') if request else None
+    if size in RENDITION_SIZES and data.get('images'):
+        data['image'] = data['images'][size]['jpeg']
+    return data
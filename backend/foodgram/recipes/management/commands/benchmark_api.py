@@ -0,0 +1,180 @@
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted values"""
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def endpoint_urls(user):
+    """Benchmarked requests of the main API endpoints"""
+    tags = '&'.join(
+        f'tags={slug}'
+        for slug in Tag.objects.values_list('slug', flat=True)[:2])
+    recipe = (Recipe.objects.filter(recipe_in_cart__user=user).first()
+              or Recipe.objects.first())
+    ingredient = Ingredient.objects.values_list('name', flat=True).first()
+    return {
+        'recipes-list': '/api/recipes/',
+        'recipes-list?limit=50': '/api/recipes/?limit=50',
+        'recipes-list?page=10': '/api/recipes/?page=10',
+        'recipes-list?tags': f'/api/recipes/?{tags}',
+        'recipes-list?is_favorited': '/api/recipes/?is_favorited=1',
+        'recipes-list?is_in_shopping_cart':
+            '/api/recipes/?is_in_shopping_cart=1',
+        'recipes-list?author': f'/api/recipes/?author={user.pk}',
+        'recipes-detail': f'/api/recipes/{recipe.pk if recipe else 0}/',
+        'users-list': '/api/users/',
+        'users-me': '/api/users/me/',
+        'users-subscriptions': '/api/users/subscriptions/',
+        'tags-list': '/api/tags/',
+        'ingredients-list?name':
+            f'/api/ingredients/?name={(ingredient or "а")[:2]}',
+        'recipes-download-shopping-cart':
+            '/api/recipes/download_shopping_cart/?format=txt',
+        'recipes-shopping-cart-summary':
+            '/api/recipes/shopping_cart_summary/',
+    }
+
+
+class Command(BaseCommand):
+    """Measuring latency and queries of the API endpoints"""
+    help = ('Requests the main API endpoints through the test client '
+            'and writes latency percentiles and query counts as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='-',
+            help='report file, stdout by default')
+        parser.add_argument(
+            '--user', type=int,
+            help='id of the requesting user, the first one following '
+                 'authors by default')
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='measured requests per endpoint')
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='unmeasured requests per endpoint')
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='clear the cache before every request')
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints',
+            help='name of an endpoint to run, may be repeated')
+
+    def get_user(self, pk):
+        users = User.objects.order_by('pk')
+        user = (users.filter(pk=pk).first() if pk
+                else users.filter(follower__isnull=False).first()
+                or users.first())
+        if user is None:
+            raise CommandError('No user to send the requests, '
+                               'run generate_fake_data first.')
+        return user
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be positive.')
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient(HTTP_HOST='localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        urls = endpoint_urls(user)
+        if options['endpoints']:
+            unknown = set(options['endpoints']) - set(urls)
+            if unknown:
+                raise CommandError(
+                    'Unknown endpoints: {}.'.format(', '.join(unknown)))
+            urls = {name: urls[name] for name in options['endpoints']}
+        report = {
+            'meta': {
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'revision': git_revision(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'user': user.pk,
+                'repeat': options['repeat'],
+                'cold': options['cold'],
+                'sizes': {
+                    'users': User.objects.count(),
+                    'recipes': Recipe.objects.count(),
+                    'ingredients': Ingredient.objects.count(),
+                },
+            },
+            'endpoints': {
+                name: self.measure(client, url, options)
+                for name, url in urls.items()
+            },
+        }
+        content = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output'] == '-':
+            sys.stdout.write(content + '\n')
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(content + '\n')
+            self.stderr.write(f'Report is written to {options["output"]}.')
+
+    def request(self, client, url, cold):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(url)
+            content = (b''.join(response.streaming_content)
+                       if response.streaming else response.content)
+            elapsed = (time.perf_counter() - started) * 1000
+        return response.status_code, elapsed, len(queries), len(content)
+
+    def measure(self, client, url, options):
+        for _ in range(options['warmup']):
+            self.request(client, url, options['cold'])
+        timings, query_counts = [], []
+        for _ in range(options['repeat']):
+            status, elapsed, query_count, size = self.request(
+                client, url, options['cold'])
+            timings.append(elapsed)
+            query_counts.append(query_count)
+        timings.sort()
+        return {
+            'url': url,
+            'status': status,
+            'bytes': size,
+            'queries': max(query_counts),
+            'queries_min': min(query_counts),
+            'ms': {
+                'p50': round(percentile(timings, 50), 2),
+                'p90': round(percentile(timings, 90), 2),
+                'p95': round(percentile(timings, 95), 2),
+                'p99': round(percentile(timings, 99), 2),
+                'max': round(timings[-1], 2),
+                'mean': round(sum(timings) / len(timings), 2),
+            },
+        }
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+
+def endpoint_queries(user):
+    """Main queries of the API endpoints for the given user"""
+    recipes = Recipe.objects.with_user_flags(user)
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    tags = list(Tag.objects.values_list('id', flat=True)[:2]) or [0]
+    return {
+        'recipes-list': recipes[:page_size],
+        'recipes-list?tags':
+            recipes.filter(tags__in=tags).distinct()[:page_size],
+        'recipes-list?is_favorited':
+            recipes.filter(favorite_recipe__user=user)[:page_size],
+        'recipes-list?is_in_shopping_cart':
+            recipes.filter(recipe_in_cart__user=user)[:page_size],
+        'recipes-list?author': recipes.filter(author=user)[:page_size],
+        'recipes-detail': recipes.filter(
+            pk=Recipe.objects.values_list('pk', flat=True).first() or 0),
+        'recipes-download-shopping-cart': (
+            RecipeIngredient.objects
+            .filter(recipe__recipe_in_cart__user=user)
+            .values('ingredient')
+            .annotate(total_amount=Sum('amount'))
+        ),
+        'users-list': User.objects.all()[:page_size],
+        'users-subscriptions':
+            User.objects.filter(following__user=user)[:page_size],
+        'ingredients-list?name': Ingredient.objects.filter(
+            name__istartswith='а'),
+    }
+
+
+class Command(BaseCommand):
+    """Printing EXPLAIN of the main endpoint queries"""
+    help = 'Prints query plans of the main API queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', help='id of the user the queries are built for')
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='run EXPLAIN ANALYZE (PostgreSQL)')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(pk=options['user'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No user to build the queries for.')
+        explain_options = {'analyze': True} if options['analyze'] else {}
+        for name, queryset in endpoint_queries(user).items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import posixpath
+import shutil
+import sys
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe, RecipeIngredient
+
+
+def export_image(name, directory, storage=default_storage):
+    """Copies the image to <directory>/<sha256 of content>.<extension>
+    unless it is already there. Returns the file name."""
+    digest = hashlib.sha256()
+    with storage.open(name) as file:
+        for chunk in file.chunks():
+            digest.update(chunk)
+    extension = posixpath.splitext(name)[1].lower()
+    filename = digest.hexdigest() + extension
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        with storage.open(name) as source, open(path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+    return filename
+
+
+def recipe_chunks(chunk_size):
+    """Yields lists of recipes read with a server-side cursor"""
+    recipes = (
+        Recipe.objects.select_related('author')
+        .order_by('pk')
+        .iterator(chunk_size=chunk_size)
+    )
+    while True:
+        chunk = list(islice(recipes, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def chunk_relations(recipes):
+    """Tags and ingredients of the recipes, two queries per chunk"""
+    tags = {recipe.pk: [] for recipe in recipes}
+    ingredients = {recipe.pk: [] for recipe in recipes}
+    tag_rows = Recipe.tags.through.objects.filter(
+        recipe__in=tags).values_list(
+        'recipe', 'tag__name', 'tag__color', 'tag__slug')
+    for recipe, name, color, slug in tag_rows:
+        tags[recipe].append({'name': name, 'color': color, 'slug': slug})
+    ingredient_rows = RecipeIngredient.objects.filter(
+        recipe__in=ingredients).values_list(
+        'recipe', 'ingredient__name', 'ingredient__measurement_unit',
+        'amount')
+    for recipe, name, measurement_unit, amount in ingredient_rows:
+        ingredients[recipe].append({
+            'name': name,
+            'measurement_unit': measurement_unit,
+            'amount': amount
+        })
+    return tags, ingredients
+
+
+class Command(BaseCommand):
+    """Exporting recipes as JSON Lines"""
+    help = ('Writes recipes with their tags, ingredients and author '
+            'as JSON Lines, one recipe per line.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='file to write, stdout by default')
+        parser.add_argument(
+            '--images',
+            help='directory to copy the images to, named by content hash')
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='recipes read per query')
+
+    def handle(self, *args, **options):
+        if options['images']:
+            os.makedirs(options['images'], exist_ok=True)
+        if options['path'] == '-':
+            count = self.export(sys.stdout, options)
+        else:
+            with open(options['path'], 'w', encoding='utf-8') as file:
+                count = self.export(file, options)
+        self.stderr.write(f'Recipes exported: {count}.')
+
+    def export(self, file, options):
+        count = 0
+        for recipes in recipe_chunks(options['chunk_size']):
+            tags, ingredients = chunk_relations(recipes)
+            for recipe in recipes:
+                image = None
+                if recipe.image and options['images']:
+                    try:
+                        image = export_image(
+                            recipe.image.name, options['images'])
+                    except OSError as error:
+                        self.stderr.write(f'{recipe.name}: {error}')
+                file.write(json.dumps({
+                    'name': recipe.name,
+                    'text': recipe.text,
+                    'cooking_time': recipe.cooking_time,
+                    'pub_date': recipe.pub_date.isoformat(),
+                    'author': {
+                        'email': recipe.author.email,
+                        'username': recipe.author.username
+                    },
+                    'tags': tags[recipe.pk],
+                    'ingredients': ingredients[recipe.pk],
+                    'image': image
+                }, ensure_ascii=False) + '\n')
+            count += len(recipes)
+        return count
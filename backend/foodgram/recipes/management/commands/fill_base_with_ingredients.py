@@ -1,23 +1,153 @@
 import csv
+import io
+import json
 import os
+import sys
+import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 from foodgram.settings import BASE_DIR
 from recipes.models import Ingredient
+from recipes.signals import ingredients_loaded
 
 
-def create_ingredient(income):
-    """Creates Ingredient objects, where "income" is a row in .csv file"""
-    Ingredient.objects.get_or_create(name=income[0],
-                                     measurement_unit=income[1])
+def read_json(file):
+    """Yields ("Item <number>", name, measurement_unit) of a .json file"""
+    try:
+        items = json.load(file)
+    except ValueError as error:
+        raise CommandError(f'Invalid JSON: {error}')
+    if not isinstance(items, list):
+        raise CommandError('The file must contain a list of ingredients.')
+    for number, item in enumerate(items, 1):
+        if not isinstance(item, dict) or not all(
+                isinstance(item.get(key), str)
+                for key in ('name', 'measurement_unit')):
+            raise CommandError(
+                f'Item {number}: "name" and "measurement_unit" strings '
+                f'are expected.')
+        yield f'Item {number}', item['name'], item['measurement_unit']
+
+
+def read_csv(file):
+    """Yields ("Line <number>", name, measurement_unit) of a .csv file,
+    empty lines are skipped"""
+    reader = csv.reader(file)
+    for row in reader:
+        if not row:
+            continue
+        if len(row) < 2:
+            raise CommandError(
+                f'Line {reader.line_num}: name and measurement unit '
+                f'are expected.')
+        yield f'Line {reader.line_num}', row[0], row[1]
+
+
+def read_ingredients(file, file_format):
+    """Yields (position, name, measurement_unit) of a .csv or .json file,
+    raises CommandError naming the position of a malformed row"""
+    rows = read_json(file) if file_format == 'json' else read_csv(file)
+    for position, name, measurement_unit in rows:
+        yield position, name.strip(), measurement_unit.strip()
+
+
+def copy_ingredients(ingredients):
+    """PostgreSQL: COPY into a temporary table and insert new rows
+    from it. Returns the number of inserted ingredients."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(ingredients)
+    buffer.seek(0)
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE ingredient_load '
+            '(name varchar(200), measurement_unit varchar(200)) '
+            'ON COMMIT DROP')
+        cursor.copy_expert(
+            'COPY ingredient_load FROM STDIN WITH (FORMAT csv)', buffer)
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            f'SELECT name, measurement_unit FROM ingredient_load '
+            f'ON CONFLICT (name, measurement_unit) DO NOTHING')
+        return cursor.rowcount
+
+
+def create_ingredients(ingredients, batch_size):
+    """Inserts the ingredients in batches, skipping existing ones.
+    Returns the number of inserted ingredients."""
+    count = Ingredient.objects.count()
+    with transaction.atomic():
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in ingredients),
+            batch_size=batch_size,
+            ignore_conflicts=True
+        )
+    return Ingredient.objects.count() - count
 
 
 class Command(BaseCommand):
-    """Reading the .csv file and filling the database"""
+    """Loading the ingredients catalog from a .csv or .json file"""
+    help = ('Adds ingredients from a .csv (name,measurement_unit) or '
+            '.json ([{"name": ..., "measurement_unit": ...}]) file, '
+            'existing ones are skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(BASE_DIR, 'ingredients.csv'),
+            help='file to load, "-" reads stdin (ingredients.csv by default)')
+        parser.add_argument(
+            '--format', choices=('csv', 'json'),
+            help='file format, taken from the extension by default')
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='rows per INSERT query, the database limit by default')
+
+    def get_format(self, path, file_format):
+        if file_format:
+            return file_format
+        extension = os.path.splitext(path)[1].lstrip('.').lower()
+        if extension not in ('csv', 'json'):
+            raise CommandError('Set --format of the file to load.')
+        return extension
+
+    def load(self, file, file_format):
+        ingredients = {}
+        for position, name, measurement_unit in read_ingredients(
+                file, file_format):
+            if not name or not measurement_unit:
+                raise CommandError(f'{position}: empty value.')
+            if max(len(name), len(measurement_unit)) > 200:
+                raise CommandError(f'{position}: value is too long.')
+            ingredients.setdefault((name, measurement_unit), None)
+        return list(ingredients)
+
     def handle(self, *args, **options):
-        path = os.path.join(BASE_DIR, 'ingredients.csv')
-        with open(path, 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            for ingredient in reader:
-                create_ingredient(ingredient)
-        self.stdout.write('Database is filled with ingredients!')
+        started = time.perf_counter()
+        path = options['path']
+        file_format = self.get_format(path, options['format'])
+        if path == '-':
+            ingredients = self.load(sys.stdin, file_format)
+        else:
+            with open(path, 'r', encoding='utf-8') as file:
+                ingredients = self.load(file, file_format)
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit'))
+        new_ingredients = [
+            ingredient for ingredient in ingredients
+            if ingredient not in existing
+        ]
+        inserted = 0
+        if new_ingredients and connection.vendor == 'postgresql':
+            inserted = copy_ingredients(new_ingredients)
+        elif new_ingredients:
+            inserted = create_ingredients(
+                new_ingredients, options['batch_size'])
+        if inserted:
+            ingredients_loaded.send(sender=Ingredient)
+        self.stdout.write(
+            'Ingredients inserted: {}, skipped: {} ({:.2f} s).'.format(
+                inserted, len(ingredients) - inserted,
+                time.perf_counter() - started))
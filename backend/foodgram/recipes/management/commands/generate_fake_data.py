@@ -0,0 +1,210 @@
+import io
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+from recipes.images import save_renditions
+from recipes.models import (FavoriteRecipe, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag)
+from recipes.signals import ingredients_loaded
+from users.models import Follow, User
+
+SCALES = {
+    'small': {'users': 50, 'recipes': 500, 'ingredients': 300, 'tags': 6,
+              'follows': 10, 'favorites': 20, 'carts': 5},
+    'medium': {'users': 1000, 'recipes': 20000, 'ingredients': 1000,
+               'tags': 10, 'follows': 30, 'favorites': 50, 'carts': 10},
+    'large': {'users': 10000, 'recipes': 200000, 'ingredients': 2000,
+              'tags': 20, 'follows': 50, 'favorites': 100, 'carts': 20},
+}
+FAKE_EMAIL_DOMAIN = 'example.com'
+FAKE_PASSWORD = 'fake-password'
+FAKE_IMAGES = 8
+BATCH_SIZE = 500
+EPOCH = datetime(2024, 1, 1)
+if settings.USE_TZ:
+    EPOCH = timezone.make_aware(EPOCH)
+
+
+def fake_users():
+    return User.objects.filter(
+        username__startswith='fake',
+        email__endswith=f'@{FAKE_EMAIL_DOMAIN}')
+
+
+def batches(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    """Generating deterministic fake data for load testing"""
+    help = ('Creates fake users, follows, recipes, ingredients, favorites '
+            'and carts. The same --seed and sizes give the same data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', choices=SCALES, default='small',
+            help='preset of the sizes below')
+        for name in SCALES['small']:
+            parser.add_argument(
+                f'--{name}', type=int,
+                help=f'overrides the number of {name} '
+                     f'(follows, favorites and carts are per user)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='delete previously generated users with their data first')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        sizes = {
+            name: options[name] if options[name] is not None else size
+            for name, size in SCALES[options['scale']].items()
+        }
+        if options['clear']:
+            fake_users().delete()
+        elif fake_users().exists():
+            raise CommandError('Fake data is already generated, '
+                               'use --clear to generate it again.')
+        self.random = random.Random(options['seed'])
+        tags = self.create_tags(sizes['tags'])
+        ingredients = self.create_ingredients(sizes['ingredients'])
+        images = self.create_images()
+        users = self.create_users(sizes['users'])
+        recipes = self.create_recipes(
+            sizes['recipes'], users, tags, ingredients, images)
+        self.create_follows(users, sizes['follows'])
+        self.create_relations(FavoriteRecipe, users, recipes,
+                              sizes['favorites'])
+        self.create_relations(ShoppingCart, users, recipes, sizes['carts'])
+        Recipe.objects.filter(author__in=fake_users()).update_counters()
+        fake_users().update_counters()
+        ShoppingListItem.objects.rebuild(fake_users())
+        FeedEntry.objects.rebuild(fake_users())
+        self.stdout.write(
+            'Generated {} users, {} recipes ({:.1f} s).'.format(
+                len(users), len(recipes), time.perf_counter() - started))
+
+    def create_tags(self, count):
+        tags = list(Tag.objects.order_by('pk')[:count])
+        for number in range(len(tags), count):
+            tags.append(Tag.objects.create(
+                name=f'Тег {number}',
+                slug=f'fake-{number}',
+                color='#{:06x}'.format(self.random.randrange(0x1000000))))
+        return [tag.pk for tag in tags]
+
+    def create_ingredients(self, count):
+        existing = Ingredient.objects.count()
+        if existing < count:
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=f'ингредиент {number}',
+                            measurement_unit=self.random.choice(
+                                ('г', 'мл', 'шт.', 'ст. л.')))
+                 for number in range(existing, count)),
+                ignore_conflicts=True
+            )
+            ingredients_loaded.send(sender=Ingredient)
+        return list(
+            Ingredient.objects.order_by('name', 'pk')
+            .values_list('pk', flat=True)[:count])
+
+    def create_images(self, storage=default_storage):
+        names = []
+        for number in range(FAKE_IMAGES):
+            name = f'recipes/fake_{number}.jpg'
+            if not storage.exists(name):
+                color = random.Random(number).randrange(0x1000000)
+                image = Image.new('RGB', (1280, 960), color)
+                buffer = io.BytesIO()
+                image.save(buffer, 'JPEG')
+                storage.save(name, ContentFile(buffer.getvalue()))
+                save_renditions(image, name, storage)
+            names.append(name)
+        return names
+
+    def create_users(self, count):
+        password = make_password(FAKE_PASSWORD)
+        User.objects.bulk_create(
+            (User(username=f'fake{number}',
+                  email=f'fake{number}@{FAKE_EMAIL_DOMAIN}',
+                  first_name=f'Имя{number}',
+                  last_name=f'Фамилия{number}',
+                  password=password)
+             for number in range(count))
+        )
+        return list(fake_users().order_by('pk').values_list('pk', flat=True))
+
+    def create_recipes(self, count, users, tags, ingredients, images):
+        for numbers in batches(range(count)):
+            with transaction.atomic():
+                self.create_recipes_batch(
+                    numbers, users, tags, ingredients, images)
+        return list(
+            Recipe.objects.filter(author__in=fake_users())
+            .order_by('pk').values_list('pk', flat=True))
+
+    def create_recipes_batch(self, numbers, users, tags, ingredients,
+                             images):
+        recipes = [
+            Recipe(
+                author_id=self.random.choice(users),
+                name=f'Тестовый рецепт {number}',
+                text=f'Описание рецепта {number}. ' * 5,
+                cooking_time=self.random.randint(5, 180),
+                image=self.random.choice(images)
+            ) for number in numbers
+        ]
+        Recipe.objects.bulk_create(recipes)
+        # bulk_create sets pub_date to now and leaves pk unset on SQLite
+        pks = dict(Recipe.objects.filter(
+            name__in=[recipe.name for recipe in recipes]
+        ).values_list('name', 'pk'))
+        for recipe in recipes:
+            recipe.pk = pks[recipe.name]
+            recipe.pub_date = EPOCH + timedelta(
+                minutes=self.random.randrange(365 * 24 * 60))
+        Recipe.objects.bulk_update(recipes, ('pub_date',))
+        Recipe.objects.filter(pk__in=pks.values()).update_search_vector()
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag)
+            for recipe in recipes
+            for tag in self.random.sample(
+                tags, min(len(tags), self.random.randint(1, 3)))
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe_id=recipe.pk, ingredient_id=ingredient,
+                             amount=self.random.randint(1, 500))
+            for recipe in recipes
+            for ingredient in self.random.sample(
+                ingredients, min(len(ingredients),
+                                 self.random.randint(3, 12)))
+        )
+
+    def create_follows(self, users, per_user):
+        follows = []
+        for user in users:
+            authors = self.random.sample(users, min(len(users), per_user + 1))
+            authors = [author for author in authors if author != user]
+            follows.extend(
+                Follow(user_id=user, author_id=author)
+                for author in authors[:per_user])
+        Follow.objects.bulk_create(follows)
+
+    def create_relations(self, model, users, recipes, per_user):
+        model.objects.bulk_create(
+            (model(user_id=user, recipe_id=recipe)
+             for user in users
+             for recipe in self.random.sample(
+                recipes, min(len(recipes), per_user)))
+        )
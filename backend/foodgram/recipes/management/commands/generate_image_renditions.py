@@ -0,0 +1,38 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from recipes.images import generate_renditions, rendition_names
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Creating renditions of the existing recipe images"""
+    help = 'Generates resized renditions of recipe images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='regenerate renditions that already exist')
+
+    def handle(self, *args, **options):
+        generated = skipped = failed = 0
+        names = (
+            Recipe.objects.exclude(image='')
+            .values_list('image', flat=True)
+            .iterator()
+        )
+        for name in names:
+            if not options['force'] and all(
+                    default_storage.exists(path)
+                    for path in rendition_names(name)):
+                skipped += 1
+                continue
+            try:
+                generate_renditions(name)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+                continue
+            generated += 1
+        self.stdout.write(
+            f'Renditions generated: {generated}, '
+            f'skipped: {skipped}, failed: {failed}.')
@@ -0,0 +1,279 @@
+import json
+import os
+import posixpath
+import re
+import sys
+from itertools import islice
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from recipes.images import IMAGE_DIRECTORY
+from recipes.models import (FeedEntry, Ingredient, Recipe, RecipeIngredient,
+                            Tag)
+from recipes.signals import ingredients_loaded
+from users.models import User
+
+
+HEX_COLOR = re.compile(r'^#[a-fA-F0-9]{6}$')
+SLUG = re.compile(r'^[-a-zA-Z0-9_]+$')
+MAX_LENGTH = 200
+
+
+def check_string(value, field, max_length=None):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f'"{field}" must be a non-empty string.')
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f'"{field}" is longer than {max_length}.')
+
+
+def check_amount(value, field):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f'"{field}" must be a positive integer.')
+
+
+def check_list(value, field):
+    if not isinstance(value, list) or not all(
+            isinstance(item, dict) for item in value):
+        raise ValueError(f'"{field}" must be a list of objects.')
+
+
+def check_record(record):
+    """Raises ValueError describing the first malformed field
+    of an exported recipe"""
+    if not isinstance(record, dict):
+        raise ValueError('A recipe object is expected.')
+    check_string(record.get('name'), 'name', MAX_LENGTH)
+    check_string(record.get('text'), 'text')
+    check_amount(record.get('cooking_time'), 'cooking_time')
+    try:
+        pub_date = parse_datetime(record.get('pub_date'))
+    except (TypeError, ValueError):
+        pub_date = None
+    if pub_date is None:
+        raise ValueError('"pub_date" must be a date and time.')
+    if not isinstance(record.get('author'), dict):
+        raise ValueError('"author" must be an object.')
+    check_string(record['author'].get('email'), 'author.email')
+    image = record.get('image')
+    if image is not None and not (
+            isinstance(image, str) and posixpath.basename(image) == image):
+        raise ValueError('"image" must be a file name.')
+    check_tags(record.get('tags'))
+    check_ingredients(record.get('ingredients'))
+
+
+def check_tags(tags):
+    check_list(tags, 'tags')
+    slugs = set()
+    for tag in tags:
+        check_string(tag.get('name'), 'tags.name', MAX_LENGTH)
+        check_string(tag.get('slug'), 'tags.slug', MAX_LENGTH)
+        if not SLUG.match(tag['slug']):
+            raise ValueError(f'Tag slug "{tag["slug"]}" is not a slug.')
+        if not isinstance(tag.get('color'), str) or not HEX_COLOR.match(
+                tag['color']):
+            raise ValueError('"tags.color" must be a HEX color.')
+        if tag['slug'] in slugs:
+            raise ValueError(f'Tag "{tag["slug"]}" is repeated.')
+        slugs.add(tag['slug'])
+
+
+def check_ingredients(ingredients):
+    check_list(ingredients, 'ingredients')
+    keys = set()
+    for ingredient in ingredients:
+        check_string(ingredient.get('name'), 'ingredients.name', MAX_LENGTH)
+        check_string(ingredient.get('measurement_unit'),
+                     'ingredients.measurement_unit', MAX_LENGTH)
+        check_amount(ingredient.get('amount'), 'ingredients.amount')
+        key = (ingredient['name'], ingredient['measurement_unit'])
+        if key in keys:
+            raise ValueError(f'Ingredient "{key[0]}" is repeated.')
+        keys.add(key)
+
+
+def import_image(filename, directory, storage=default_storage):
+    """Copies an exported image to the storage. Images are named by
+    content hash, so the one already stored is reused."""
+    name = posixpath.join(IMAGE_DIRECTORY, filename)
+    if not storage.exists(name):
+        with open(os.path.join(directory, filename), 'rb') as file:
+            storage.save(name, File(file))
+    return name
+
+
+class Command(BaseCommand):
+    """Importing recipes exported by export_recipes"""
+    help = ('Creates recipes from JSON Lines written by export_recipes. '
+            'Recipes with an existing name or an unknown author '
+            'are skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='file to read, stdin by default')
+        parser.add_argument(
+            '--images',
+            help='directory of the exported images')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='recipes created per transaction')
+
+    def handle(self, *args, **options):
+        self.tags = {tag.slug: tag for tag in Tag.objects.all()}
+        self.tag_values = {
+            slug: (tag.name, tag.color) for slug, tag in self.tags.items()}
+        self.created = self.skipped = 0
+        if options['path'] == '-':
+            self.import_lines(sys.stdin, options)
+        else:
+            with open(options['path'], 'r', encoding='utf-8') as file:
+                self.import_lines(file, options)
+        self.stdout.write(
+            f'Recipes created: {self.created}, skipped: {self.skipped}. '
+            f'Run generate_image_renditions for the imported images.')
+
+    def import_lines(self, file, options):
+        """Imports the lines batch by batch. Every record of a batch
+        is checked before the batch is written, so a malformed line
+        stops the import after the previous batches."""
+        lines = (
+            (number, line) for number, line in enumerate(file, 1)
+            if line.strip()
+        )
+        while True:
+            batch = list(islice(lines, options['batch_size']))
+            if not batch:
+                return
+            records = []
+            for line_number, line in batch:
+                try:
+                    record = json.loads(line)
+                    check_record(record)
+                    self.check_tags(record)
+                except ValueError as error:
+                    raise CommandError(f'Line {line_number}: {error}')
+                records.append(record)
+            with transaction.atomic():
+                self.import_batch(records, options['images'])
+
+    def check_tags(self, record):
+        """Tags must match the existing ones and the ones
+        of the previous records with the same slug"""
+        for tag in record['tags']:
+            values = (tag['name'], tag['color'])
+            known = self.tag_values.setdefault(tag['slug'], values)
+            if known != values:
+                raise ValueError(
+                    f'Tag "{tag["slug"]}" differs from the existing one.')
+
+    def get_tags(self, records):
+        """Tags by slug, creating the missing ones"""
+        for record in records:
+            for tag in record['tags']:
+                if tag['slug'] not in self.tags:
+                    self.tags[tag['slug']] = Tag.objects.create(
+                        name=tag['name'], color=tag['color'],
+                        slug=tag['slug'])
+        return self.tags
+
+    @staticmethod
+    def get_ingredients(records):
+        """Ingredients by (name, measurement_unit), missing ones
+        are inserted in bulk"""
+        keys = {
+            (ingredient['name'], ingredient['measurement_unit'])
+            for record in records for ingredient in record['ingredients']
+        }
+        names = {name for name, _ in keys}
+        ingredients = {
+            (ingredient.name, ingredient.measurement_unit): ingredient
+            for ingredient in Ingredient.objects.filter(name__in=names)
+        }
+        missing = keys - set(ingredients)
+        if not missing:
+            return ingredients
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in missing),
+            ignore_conflicts=True
+        )
+        transaction.on_commit(
+            lambda: ingredients_loaded.send(sender=Ingredient))
+        return {
+            (ingredient.name, ingredient.measurement_unit): ingredient
+            for ingredient in Ingredient.objects.filter(name__in=names)
+        }
+
+    def new_records(self, records):
+        """Records with a known author and a name not taken yet"""
+        authors = User.objects.in_bulk(
+            {record['author']['email'] for record in records},
+            field_name='email')
+        taken = set(Recipe.objects.filter(
+            name__in=[record['name'] for record in records]
+        ).values_list('name', flat=True))
+        new = []
+        for record in records:
+            author = authors.get(record['author']['email'])
+            if author is None:
+                self.stderr.write(
+                    f'{record["name"]}: no author '
+                    f'{record["author"]["email"]}.')
+            if author is None or record['name'] in taken:
+                self.skipped += 1
+                continue
+            taken.add(record['name'])
+            new.append((record, author))
+        return new
+
+    def import_batch(self, records, images):
+        new = self.new_records(records)
+        if not new:
+            return
+        tags = self.get_tags(record for record, _ in new)
+        ingredients = self.get_ingredients([record for record, _ in new])
+        recipes = [
+            Recipe(
+                author=author,
+                name=record['name'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                image=(import_image(record['image'], images)
+                       if record.get('image') and images else '')
+            ) for record, author in new
+        ]
+        Recipe.objects.bulk_create(recipes)
+        # bulk_create sets pub_date to now and leaves pk unset on SQLite
+        pks = dict(Recipe.objects.filter(
+            name__in=[recipe.name for recipe in recipes]
+        ).values_list('name', 'pk'))
+        for recipe, (record, _) in zip(recipes, new):
+            recipe.pk = pks[recipe.name]
+            recipe.pub_date = parse_datetime(record['pub_date'])
+        Recipe.objects.bulk_update(recipes, ('pub_date',))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tags[tag['slug']])
+            for recipe, (record, _) in zip(recipes, new)
+            for tag in record['tags']
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredients[
+                    (ingredient['name'], ingredient['measurement_unit'])],
+                amount=ingredient['amount']
+            )
+            for recipe, (record, _) in zip(recipes, new)
+            for ingredient in record['ingredients']
+        )
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in recipes]).update_search_vector()
+        FeedEntry.objects.fan_out(recipes)
+        User.objects.filter(
+            pk__in={recipe.author_id for recipe in recipes}
+        ).update_counters()
+        self.created += len(recipes)
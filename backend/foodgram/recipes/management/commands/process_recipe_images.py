@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.tasks import process_recipe_image
+
+
+class Command(BaseCommand):
+    """Processing recipe images left by the image worker"""
+    help = ('Processes recipe images still waiting for the image worker, '
+            'e.g. after a restart of the web workers.')
+
+    def handle(self, *args, **options):
+        pending = (
+            Recipe.objects.filter(image_state=Recipe.IMAGE_PROCESSING)
+            .exclude(image_upload='')
+            .values_list('pk', 'image_upload')
+        )
+        for recipe_id, upload_name in pending:
+            process_recipe_image(recipe_id, upload_name)
+        states = Recipe.objects.filter(
+            pk__in=[recipe_id for recipe_id, _ in pending])
+        self.stdout.write(
+            'Images processed: {}, failed: {}.'.format(
+                states.filter(image_state=Recipe.IMAGE_READY).count(),
+                states.filter(image_state=Recipe.IMAGE_FAILED).count()))
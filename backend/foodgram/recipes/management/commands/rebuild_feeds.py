@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import FeedEntry
+
+
+class Command(BaseCommand):
+    """Rebuilding users' subscription feeds"""
+    help = ('Refills the feed timelines from the follows and the recipes '
+            'of the followed authors.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id of a user to process, may be repeated')
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='entries inserted per query')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            FeedEntry.objects.rebuild(options['users'],
+                                      options['batch_size'])
+        entries = FeedEntry.objects.all()
+        if options['users']:
+            entries = entries.filter(user__in=options['users'])
+        self.stdout.write(
+            f'Feeds are rebuilt, entries: {entries.count()}.')
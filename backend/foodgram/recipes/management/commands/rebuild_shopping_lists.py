@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import ShoppingListItem
+
+
+def find_mismatches(users=None):
+    """Returns {(user, ingredient): (stored, expected)} of wrong totals"""
+    stored = ShoppingListItem.objects.all()
+    if users is not None:
+        stored = stored.filter(user__in=users)
+    stored = {
+        (user, ingredient): total_amount
+        for user, ingredient, total_amount
+        in stored.values_list('user', 'ingredient', 'total_amount')
+    }
+    expected = {
+        (user, ingredient): total_amount
+        for user, ingredient, total_amount
+        in ShoppingListItem.objects.expected_totals(users)
+    }
+    return {
+        key: (stored.get(key), expected.get(key))
+        for key in {*stored, *expected}
+        if stored.get(key) != expected.get(key)
+    }
+
+
+class Command(BaseCommand):
+    """Verifying and rebuilding users' shopping list totals"""
+    help = 'Rebuilds shopping list totals from the users\' carts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='only report totals that differ from the carts')
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id of a user to process, may be repeated')
+
+    def handle(self, *args, **options):
+        users = options['users']
+        mismatches = find_mismatches(users)
+        for (user, ingredient), (stored, expected) in sorted(
+                mismatches.items()):
+            self.stdout.write(
+                f'user {user}, ingredient {ingredient}: '
+                f'stored {stored}, expected {expected}')
+        if options['verify']:
+            self.stdout.write(f'Mismatched totals: {len(mismatches)}')
+            return
+        with transaction.atomic():
+            ShoppingListItem.objects.rebuild(users)
+        self.stdout.write('Shopping lists are rebuilt!')
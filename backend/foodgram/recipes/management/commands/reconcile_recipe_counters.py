@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from recipes.models import Recipe
+
+
+def find_mismatches():
+    """Returns recipes whose counters differ from their relations,
+    annotated with the expected_<counter> values"""
+    expected = {
+        f'expected_{field}': count
+        for field, count in Recipe.objects.counted_relations().items()
+    }
+    mismatched = Q()
+    for field in Recipe.objects.counted_relations():
+        mismatched |= ~Q(**{field: F(f'expected_{field}')})
+    return (
+        Recipe.objects.annotate(**expected).filter(mismatched)
+        .order_by('pk')
+    )
+
+
+class Command(BaseCommand):
+    """Verifying and repairing popularity counters of recipes"""
+    help = ('Recounts "favorites_count" and "in_carts_count" of recipes '
+            'from the favorites and the carts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='only report recipes with wrong counters')
+
+    def handle(self, *args, **options):
+        mismatches = list(find_mismatches().values_list(
+            'pk', 'favorites_count', 'expected_favorites_count',
+            'in_carts_count', 'expected_in_carts_count'))
+        for pk, favorites, expected_favorites, carts, expected_carts in (
+                mismatches):
+            self.stdout.write(
+                f'recipe {pk}: favorites {favorites}, '
+                f'expected {expected_favorites}; carts {carts}, '
+                f'expected {expected_carts}')
+        if options['verify']:
+            self.stdout.write(f'Mismatched recipes: {len(mismatches)}')
+            return
+        updated = Recipe.objects.filter(
+            pk__in=[pk for pk, *_ in mismatches]).update_counters()
+        self.stdout.write(f'Recipe counters are repaired: {updated}.')
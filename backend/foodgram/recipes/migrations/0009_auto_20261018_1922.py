@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:22
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Moves recipes and shopping lists of duplicate ingredients
+    to the first of them, so that the unique constraint can be added"""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = (
+        Ingredient.objects.values('name', 'measurement_unit')
+        .annotate(count=Count('id'), first_id=Min('id'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates:
+        first_id = duplicate['first_id']
+        others = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit']
+        ).exclude(id=first_id)
+        for model, owner, amount in (
+                (RecipeIngredient, 'recipe', 'amount'),
+                (ShoppingListItem, 'user', 'total_amount')):
+            for row in model.objects.filter(ingredient__in=others):
+                merged = model.objects.filter(
+                    **{owner: getattr(row, f'{owner}_id')},
+                    ingredient_id=first_id
+                ).update(**{amount: F(amount) + getattr(row, amount)})
+                if merged:
+                    row.delete()
+                else:
+                    row.ingredient_id = first_id
+                    row.save()
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_auto_20261018_1918'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
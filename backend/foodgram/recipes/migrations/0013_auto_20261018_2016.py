@@ -0,0 +1,21 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:16
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_auto_20261018_1941'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='favoriterecipe',
+            name='favorite_recipe_user_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='shoppingcart',
+            name='cart_recipe_user_idx',
+        ),
+    ]
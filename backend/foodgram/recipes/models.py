@@ -1,6 +1,15 @@
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField)
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
-from users.models import User
+from django.db import connections, models, transaction
+from django.db.models import (Case, Count, Exists, F, OuterRef, Prefetch, Q,
+                              Subquery, Sum, Value, When, Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Greatest, RowNumber
+from users.models import Follow, User
+
+SEARCH_CONFIG = 'russian'
 
 
 class Tag(models.Model):
@@ -48,6 +57,12 @@ class Ingredient(models.Model):
 
     class Meta:
         ordering = ('name',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            )
+        ]
         verbose_name = 'Ингридиент'
         verbose_name_plural = 'Ингридиенты'
 
@@ -55,8 +70,127 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RawSubquery(RawSQL):
+    """Raw SELECT for "__in" lookups, which already wrap
+    their right-hand side in parentheses"""
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Queryset with helpers for recipe payloads"""
+
+    @staticmethod
+    def payload_prefetches():
+        """Lookups for tags and ingredients rendered in recipe payloads"""
+        return (
+            'tags',
+            Prefetch(
+                'recipes',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+
+    def with_related(self):
+        """Loads author, tags and ingredients needed by recipe payloads"""
+        return self.select_related('author').prefetch_related(
+            *self.payload_prefetches())
+
+    def newest_per_author(self, limit):
+        """Keeps at most "limit" newest recipes of every author.
+        The recipes are numbered per author by ROW_NUMBER() in a subquery,
+        so the filters of the queryset are applied before numbering."""
+        numbered = self.annotate(author_position=Window(
+            expression=RowNumber(),
+            partition_by=F('author'),
+            order_by=(F('pub_date').desc(), F('id').desc())
+        )).order_by().values('id', 'author_position')
+        sql, params = numbered.query.sql_with_params()
+        return self.filter(id__in=RawSubquery(
+            f'SELECT numbered.id FROM ({sql}) numbered '
+            f'WHERE numbered.author_position <= %s',
+            (*params, limit)
+        ))
+
+    @staticmethod
+    def counted_relations():
+        """Counter fields with the actual counts of their relations"""
+        return {
+            field: Coalesce(Subquery(
+                model.objects.filter(recipe=OuterRef('pk')).order_by()
+                .values('recipe').annotate(count=Count('id'))
+                .values('count'),
+                output_field=models.IntegerField()
+            ), 0)
+            for field, model in (('favorites_count', FavoriteRecipe),
+                                 ('in_carts_count', ShoppingCart))
+        }
+
+    def update_counters(self):
+        """Recounts favorites and carts of the recipes"""
+        return self.update(**self.counted_relations())
+
+    def change_counter(self, field, delta):
+        """Atomically adds delta to the counter field, never below zero"""
+        return self.update(**{field: Greatest(F(field) + delta, 0)})
+
+    def update_search_vector(self):
+        """Fills "search_vector" from the name and the text of the recipes.
+        The vector is only maintained on PostgreSQL."""
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+        ))
+
+    def search(self, text):
+        """Recipes matching the words of the text, the most relevant first.
+        Full-text search by the GIN-indexed "search_vector" on PostgreSQL,
+        case-insensitive substring match of the name or text elsewhere,
+        where matches in the name rank above matches in the text only."""
+        if connections[self.db].vendor != 'postgresql':
+            found = self.filter(
+                Q(name__icontains=text) | Q(text__icontains=text)
+            ).annotate(rank=Case(
+                When(name__icontains=text, then=Value(1.0)),
+                default=Value(0.4),
+                output_field=models.FloatField()
+            ))
+        else:
+            query = SearchQuery(text, config=SEARCH_CONFIG)
+            found = self.filter(search_vector=query).annotate(
+                rank=SearchRank(F('search_vector'), query))
+        return found.order_by('-rank', '-pub_date', '-id')
+
+    def with_user_flags(self, user):
+        """Annotates "is_favorited" and "is_in_shopping_cart" for the user"""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, models.BooleanField()),
+                is_in_shopping_cart=Value(False, models.BooleanField())
+            )
+        return self.annotate(
+            is_favorited=Exists(FavoriteRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+        )
+
+
 class Recipe(models.Model):
     """Recipes model"""
+    IMAGE_PROCESSING = 'processing'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+
+    IMAGE_STATE_CHOICES = (
+        (IMAGE_PROCESSING, 'Обрабатывается'),
+        (IMAGE_READY, 'Готово'),
+        (IMAGE_FAILED, 'Не удалось обработать'),
+    )
+
     tags = models.ManyToManyField(
         Tag,
         verbose_name='Теги',
@@ -86,6 +220,17 @@ class Recipe(models.Model):
         upload_to='recipes/',
         verbose_name='Фото рецепта'
     )
+    image_state = models.CharField(
+        max_length=16,
+        choices=IMAGE_STATE_CHOICES,
+        default=IMAGE_READY,
+        verbose_name='Состояние фото'
+    )
+    image_upload = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name='Загруженное фото в обработке'
+    )
     text = models.TextField(
         blank=False,
         verbose_name='Описание рецепта'
@@ -99,9 +244,45 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата и время публикации'
     )
+    feed_fanout = models.BooleanField(
+        default=True,
+        verbose_name='Разослан в ленты подписчиков'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во добавлений в избранное'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во добавлений в корзину'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_pulled_feed_idx',
+                condition=Q(feed_fanout=False)
+            ),
+            models.Index(
+                fields=('-favorites_count', '-pub_date', '-id'),
+                name='recipe_favorites_count_idx'
+            )
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -200,3 +381,282 @@ class ShoppingCart(models.Model):
     def __str__(self):
         return (f'{self.recipe.name} '
                 f'добавлен в корзину пользователя {self.user.username}')
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    """Incremental maintenance of users' shopping list totals"""
+
+    @staticmethod
+    def recipe_amounts(recipe):
+        return dict(RecipeIngredient.objects.filter(
+            recipe=recipe).values_list('ingredient', 'amount'))
+
+    def change_amounts(self, users, amounts):
+        """Adds {ingredient id: delta} to the totals of the users"""
+        amounts = {pk: delta for pk, delta in amounts.items() if delta}
+        if not users or not amounts:
+            return
+        # missing rows only matter for added amounts
+        self.bulk_create(
+            [ShoppingListItem(user_id=user, ingredient_id=ingredient)
+             for user in users
+             for ingredient, delta in amounts.items() if delta > 0],
+            ignore_conflicts=True
+        )
+        items = self.filter(user__in=users)
+        items.filter(ingredient__in=amounts).update(
+            total_amount=F('total_amount') + Case(
+                *[When(ingredient=ingredient, then=Value(delta))
+                  for ingredient, delta in amounts.items()],
+                output_field=models.IntegerField()
+            )
+        )
+        items.filter(total_amount__lte=0).delete()
+
+    def add_recipe(self, user, recipe):
+        self.change_amounts([user.pk], self.recipe_amounts(recipe))
+
+    def remove_amounts(self, user_id, amounts):
+        """Subtracts amounts of a recipe that left the user's cart"""
+        self.change_amounts(
+            [user_id],
+            {ingredient: -amount for ingredient, amount in amounts.items()}
+        )
+
+    def update_recipe(self, recipe, old_amounts, new_amounts):
+        """Applies changed amounts of the recipe to carts holding it"""
+        self.change_amounts(
+            list(recipe.recipe_in_cart.values_list('user', flat=True)),
+            {ingredient: (new_amounts.get(ingredient, 0)
+                          - old_amounts.get(ingredient, 0))
+             for ingredient in {*old_amounts, *new_amounts}}
+        )
+
+    def rebuild_carts(self, recipes):
+        """Recomputes the lists of the users holding the recipes"""
+        users = list(
+            ShoppingCart.objects.filter(recipe__in=recipes)
+            .values_list('user', flat=True).distinct())
+        if users:
+            self.rebuild(users)
+
+    @staticmethod
+    def expected_totals(users=None):
+        """Totals aggregated from the carts: (user, ingredient, amount)"""
+        # a single filter() call, so that the carts are joined once
+        if users is None:
+            carts = RecipeIngredient.objects.filter(
+                recipe__recipe_in_cart__isnull=False)
+        else:
+            carts = RecipeIngredient.objects.filter(
+                recipe__recipe_in_cart__user__in=users)
+        return (
+            carts.values('recipe__recipe_in_cart__user', 'ingredient')
+            .annotate(total_amount=Sum('amount'))
+            .values_list('recipe__recipe_in_cart__user', 'ingredient',
+                         'total_amount')
+            .order_by()
+        )
+
+    def rebuild(self, users=None, batch_size=None):
+        items = self.all() if users is None else self.filter(user__in=users)
+        items.delete()
+        self.bulk_create(
+            (ShoppingListItem(user_id=user, ingredient_id=ingredient,
+                              total_amount=total_amount)
+             for user, ingredient, total_amount
+             in self.expected_totals(users).iterator()),
+            batch_size=batch_size
+        )
+
+
+class ShoppingListItem(models.Model):
+    """Total amount of an ingredient in the user's shopping cart"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.IntegerField(
+        default=0,
+        verbose_name='Количество'
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            ),
+        ]
+
+    def __str__(self):
+        return (f'{self.user.username}: {self.ingredient.name} - '
+                f'{self.total_amount} {self.ingredient.measurement_unit}')
+
+
+class FeedEntryQuerySet(models.QuerySet):
+    """Timelines of recipes from followed authors.
+    A new recipe is copied to the timelines of its author's followers
+    (fan-out). Recipes of authors with more than FEED_FANOUT_MAX_FOLLOWERS
+    followers are not copied but marked "feed_fanout=False" and read
+    from the recipes table when the feed is requested."""
+
+    def fan_out(self, recipes, batch_size=None):
+        """Adds the recipes to the timelines of their authors' followers"""
+        recipes = [recipe for recipe in recipes if recipe.feed_fanout]
+        followers = Follow.objects.filter(
+            author__in={recipe.author_id for recipe in recipes})
+        counts = dict(
+            followers.values('author').annotate(count=Count('id'))
+            .values_list('author', 'count').order_by()
+        )
+        pulled = {
+            author for author, count in counts.items()
+            if count > settings.FEED_FANOUT_MAX_FOLLOWERS
+        }
+        if pulled:
+            Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe in recipes
+                        if recipe.author_id in pulled]
+            ).update(feed_fanout=False)
+        authors = {author: [] for author in counts if author not in pulled}
+        if not authors:
+            return
+        for author, user in followers.filter(author__in=authors).values_list(
+                'author', 'user').order_by().iterator():
+            authors[author].append(user)
+        self.bulk_create(
+            (FeedEntry(user_id=user, recipe_id=recipe.pk,
+                       author_id=recipe.author_id, pub_date=recipe.pub_date)
+             for recipe in recipes
+             for user in authors.get(recipe.author_id, ())),
+            batch_size=batch_size,
+            ignore_conflicts=True
+        )
+
+    def add_author(self, user_id, author_id, batch_size=None):
+        """Backfills the timeline with the recipes of a followed author.
+        The follow is locked, so an unfollow either waits for the backfill
+        and trims it or has already removed the follow."""
+        with transaction.atomic():
+            follow = (
+                Follow.objects.select_for_update()
+                .filter(user_id=user_id, author_id=author_id).first()
+            )
+            if follow is None:
+                return
+            recipes = Recipe.objects.filter(
+                author_id=author_id, feed_fanout=True
+            ).values_list('pk', 'pub_date').order_by()
+            self.bulk_create(
+                (FeedEntry(user_id=user_id, recipe_id=recipe,
+                           author_id=author_id, pub_date=pub_date)
+                 for recipe, pub_date in recipes.iterator()),
+                batch_size=batch_size,
+                ignore_conflicts=True
+            )
+
+    def remove_author(self, user_id, author_id):
+        """Trims the recipes of an unfollowed author from the timeline"""
+        self.filter(user_id=user_id, author_id=author_id).delete()
+
+    def page(self, user, position, size):
+        """Recipe ids of the feed, newest first, after position
+        (pub_date, recipe id) or from the start for None.
+        The timeline is read by one range scan of its index and merged
+        with pulled recipes of followed authors."""
+        entries = self.filter(user=user)
+        pulled = Recipe.objects.filter(
+            feed_fanout=False, author__following__user=user)
+        if position is not None:
+            pub_date, pk = position
+            entries = entries.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, recipe_id__lt=pk))
+            pulled = pulled.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk))
+        rows = [
+            *entries.order_by('-pub_date', '-recipe_id')
+            .values_list('pub_date', 'recipe_id')[:size],
+            *pulled.order_by('-pub_date', '-id')
+            .values_list('pub_date', 'id')[:size],
+        ]
+        return [pk for pub_date, pk in sorted(rows, reverse=True)[:size]]
+
+    def rebuild(self, users=None, batch_size=None):
+        entries = self.all() if users is None else self.filter(user__in=users)
+        entries.delete()
+        recipes = Recipe.objects.filter(feed_fanout=True)
+        if users is None:
+            recipes = recipes.filter(author__following__isnull=False)
+        else:
+            recipes = recipes.filter(author__following__user__in=users)
+        rows = recipes.values_list(
+            'author__following__user', 'pk', 'author', 'pub_date'
+        ).order_by()
+        self.bulk_create(
+            (FeedEntry(user_id=user, recipe_id=recipe, author_id=author,
+                       pub_date=pub_date)
+             for user, recipe, author, pub_date in rows.iterator()),
+            batch_size=batch_size
+        )
+
+
+class FeedEntry(models.Model):
+    """Recipe of a followed author in the user's feed"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        db_index=False,
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата и время публикации'
+    )
+
+    objects = FeedEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='feed_user_author_idx'
+            )
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry'
+            ),
+        ]
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Sent after ingredients are added in bulk, which skips post_save
+ingredients_loaded = Signal()
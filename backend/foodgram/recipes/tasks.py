@@ -0,0 +1,80 @@
+import logging
+from functools import partial
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from .background import run_in_background
+from .images import delete_image, open_upload, save_image, save_renditions
+from .models import FeedEntry, Recipe
+
+logger = logging.getLogger(__name__)
+
+
+def process_recipe_image(recipe_id, upload_name, storage=default_storage):
+    """Image worker: decodes and validates the uploaded image, re-encodes
+    it without EXIF, generates its renditions and sets it to the recipe.
+    Uploads superseded by a newer one while processing are dropped."""
+    try:
+        image = open_upload(upload_name, storage)
+        name = save_image(image, storage)
+        save_renditions(image, name, storage)
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        logger.warning('Image %s of recipe %s is rejected: %s',
+                       upload_name, recipe_id, error)
+        name = None
+    with transaction.atomic():
+        recipe = (
+            Recipe.objects.select_for_update()
+            .filter(pk=recipe_id, image_upload=upload_name)
+            .first()
+        )
+        if recipe is not None:
+            previous = recipe.image.name
+            if name:
+                recipe.image = name
+            recipe.image_state = (
+                Recipe.IMAGE_READY if name else Recipe.IMAGE_FAILED)
+            recipe.image_upload = ''
+            recipe.save(
+                update_fields=('image', 'image_state', 'image_upload'))
+            # the admin's upload is the previous image, it is deleted below
+            if name and previous and previous != upload_name:
+                transaction.on_commit(
+                    partial(delete_unused_image, previous, storage))
+    if recipe is None and name:
+        delete_image(name, storage)
+    # the admin hands over the stored image itself as the upload
+    in_use = Recipe.objects.filter(image=upload_name).exists()
+    if not in_use and storage.exists(upload_name):
+        storage.delete(upload_name)
+
+
+def delete_unused_image(name, storage=default_storage):
+    """Deletes a replaced image with its renditions unless a recipe
+    still uses it: imported images are shared by content hash"""
+    if not Recipe.objects.filter(image=name).exists():
+        delete_image(name, storage)
+
+
+def queue_recipe_image(recipe, upload_name):
+    """Marks the recipe image as processing and hands the upload
+    to the image worker"""
+    recipe.image_upload = upload_name
+    recipe.image_state = Recipe.IMAGE_PROCESSING
+    recipe.save(update_fields=('image_upload', 'image_state'))
+    run_in_background(process_recipe_image, recipe.pk, upload_name)
+
+
+def fan_out_recipes(recipe_ids):
+    """Feed worker: copies new recipes to the timelines of the followers"""
+    FeedEntry.objects.fan_out(
+        Recipe.objects.filter(pk__in=recipe_ids)
+        .only('id', 'author_id', 'pub_date', 'feed_fanout'))
+
+
+def backfill_feed(user_id, author_id):
+    """Feed worker: copies the recipes of a followed author
+    to the follower's timeline"""
+    FeedEntry.objects.add_author(user_id, author_id)
@@ -0,0 +1,108 @@
+import base64
+import io
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.models import (FavoriteRecipe, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag)
+from users.models import Follow, User
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+
+@pytest.fixture
+def image_base64():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'red').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class Scenario:
+    """Data of one size n: the user follows n authors with n recipes
+    each, every recipe has n ingredients and n tags, n recipes
+    are in the user's favorites and cart. The user has one own recipe."""
+
+    def __init__(self, size):
+        self.size = size
+        prefix = f's{size}'
+        self.user = User.objects.create(
+            username=f'{prefix}user', email=f'{prefix}user@example.com')
+        self.authors = [
+            User.objects.create(username=f'{prefix}author{number}',
+                                email=f'{prefix}author{number}@example.com')
+            for number in range(size)
+        ]
+        self.tags = [
+            Tag.objects.create(name=f'{prefix}tag{number}',
+                               slug=f'{prefix}tag{number}')
+            for number in range(size)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(name=f'{prefix}ingredient{number}',
+                                      measurement_unit='г')
+            for number in range(size * 2)
+        ]
+        self.recipes = []
+        for author in self.authors:
+            Follow.objects.create(user=self.user, author=author)
+            for number in range(size):
+                recipe = Recipe.objects.create(
+                    author=author,
+                    name=f'{author.username} recipe {number}',
+                    text='text', cooking_time=10,
+                    image='recipes/image.jpg')
+                recipe.tags.set(self.tags)
+                RecipeIngredient.objects.bulk_create(
+                    RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                     amount=number + 1)
+                    for ingredient in self.ingredients[:size])
+                self.recipes.append(recipe)
+        self.own_recipe = Recipe.objects.create(
+            author=self.user, name=f'{prefix}user recipe', text='text',
+            cooking_time=10, image='recipes/image.jpg')
+        self.own_recipe.tags.set(self.tags)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=self.own_recipe, ingredient=ingredient,
+                             amount=1)
+            for ingredient in self.ingredients[:size])
+        for recipe in self.recipes[:size]:
+            FavoriteRecipe.objects.create(user=self.user, recipe=recipe)
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        Recipe.objects.filter(pk__in=[
+            recipe.pk for recipe in self.recipes]).update_counters()
+        User.objects.filter(
+            pk__in=[self.user.pk, *(author.pk for author in self.authors)]
+        ).update_counters()
+        ShoppingListItem.objects.rebuild([self.user])
+        FeedEntry.objects.rebuild([self.user])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+@pytest.fixture
+def scenario(db):
+    return Scenario
+
+
+@pytest.fixture
+def count_queries():
+    """Sends a request with empty caches, returns the response
+    and the captured queries"""
+    def request(client, method, url, data=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(url, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response, queries.captured_queries
+    return request
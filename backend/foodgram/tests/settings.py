@@ -0,0 +1,21 @@
+import os
+
+from foodgram.settings import *  # noqa: F401,F403
+from foodgram.settings import DATABASES
+
+if 'DB_ENGINE' not in os.environ:
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    }
+}
+
+BACKGROUND_TASKS = 'sync'
+
+PASSWORD_HASHERS = ('django.contrib.auth.hashers.MD5PasswordHasher',)
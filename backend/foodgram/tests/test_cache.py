@@ -0,0 +1,85 @@
+from http import HTTPStatus
+
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.db import transaction
+
+from api.cache import (RECIPES_VERSION_KEY, author_version_key,
+                       recipe_version_key)
+
+
+def versions(author):
+    return cache.get_many([RECIPES_VERSION_KEY, author_version_key(author.pk)])
+
+
+def test_author_changes_refresh_recipe_payloads(transactional_db, scenario):
+    data = scenario(2)
+    recipe = data.recipes[0]
+    url = f'/api/recipes/{recipe.pk}/'
+    assert data.client.get(url).json()['author']['first_name'] == ''
+    cached = versions(recipe.author)
+    update_last_login(None, recipe.author)
+    recipe.author.set_password('new-password')
+    recipe.author.save()
+    assert versions(recipe.author) == cached
+    recipe.author.first_name = 'Автор'
+    recipe.author.save()
+    assert versions(recipe.author)[RECIPES_VERSION_KEY] == (
+        cached[RECIPES_VERSION_KEY])
+    assert data.client.get(url).json()['author']['first_name'] == 'Автор'
+
+
+def test_versions_are_bumped_on_commit(transactional_db, scenario):
+    data = scenario(2)
+    recipe = data.recipes[0]
+    url = f'/api/recipes/{recipe.pk}/'
+    data.client.get(url)
+    version = cache.get(recipe_version_key(recipe.pk))
+    with transaction.atomic():
+        recipe.name = 'renamed'
+        recipe.save()
+        assert cache.get(recipe_version_key(recipe.pk)) == version
+    assert cache.get(recipe_version_key(recipe.pk)) != version
+    assert data.client.get(url).json()['name'] == 'renamed'
+
+
+def vary(response):
+    return [header.strip() for header in response['Vary'].split(',')]
+
+
+def test_catalog_etags(transactional_db, scenario):
+    data = scenario(2)
+    url = '/api/tags/'
+    response = data.client.get(url)
+    assert response.status_code == HTTPStatus.OK
+    etag = response['ETag']
+    assert etag
+    response = data.client.get(url)
+    assert response['ETag'] == etag
+    assert 'Accept' in vary(response)
+    response = data.client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response['ETag'] == etag
+    assert 'Accept' in vary(response)
+    response = data.client.get(url, HTTP_IF_NONE_MATCH=etag,
+                               HTTP_ACCEPT='text/html')
+    assert response.status_code == HTTPStatus.OK
+    assert response['ETag'] != etag
+    data.tags[0].name = 'renamed'
+    data.tags[0].save()
+    response = data.client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.OK
+    assert response['ETag'] != etag
+    assert 'renamed' in [tag['name'] for tag in response.json()]
+
+
+def test_ingredient_changes_refresh_the_etag(transactional_db, scenario):
+    data = scenario(2)
+    url = '/api/ingredients/'
+    etag = data.client.get(url)['ETag']
+    ingredient = data.ingredients[0]
+    ingredient.measurement_unit = 'кг'
+    ingredient.save()
+    response = data.client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.OK
+    assert response['ETag'] != etag
@@ -0,0 +1,27 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
+from users.models import Follow, User
+
+SIZES = {'users': 4, 'recipes': 6, 'ingredients': 5, 'tags': 2,
+         'follows': 2, 'favorites': 3, 'carts': 1}
+
+
+def test_generate_fake_data(db):
+    call_command('generate_fake_data', stdout=StringIO(), **SIZES)
+    assert User.objects.count() == SIZES['users']
+    assert Recipe.objects.count() == SIZES['recipes']
+    assert Follow.objects.count() == SIZES['users'] * SIZES['follows']
+    assert FavoriteRecipe.objects.count() == (
+        SIZES['users'] * SIZES['favorites'])
+    assert ShoppingCart.objects.count() == SIZES['users'] * SIZES['carts']
+    assert sum(Recipe.objects.values_list('favorites_count', flat=True)) == (
+        FavoriteRecipe.objects.count())
+    with pytest.raises(CommandError):
+        call_command('generate_fake_data', stdout=StringIO(), **SIZES)
+    call_command('generate_fake_data', '--clear', stdout=StringIO(), **SIZES)
+    assert Recipe.objects.count() == SIZES['recipes']
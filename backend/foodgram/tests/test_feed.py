@@ -0,0 +1,72 @@
+from http import HTTPStatus
+
+from rest_framework.test import APIClient
+
+from recipes.models import FeedEntry, Recipe
+
+
+def feed_ids(client, limit=100):
+    ids, url = [], f'/api/recipes/feed/?limit={limit}'
+    while url:
+        response = client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        ids += [recipe['id'] for recipe in response.json()['results']]
+        url = response.json()['next']
+    return ids
+
+
+def newest_first(recipes):
+    return [recipe.pk for recipe in sorted(
+        recipes, key=lambda recipe: (recipe.pub_date, recipe.pk),
+        reverse=True)]
+
+
+def create_recipe(author, scenario_data, image_base64):
+    client = APIClient()
+    client.force_authenticate(author)
+    response = client.post('/api/recipes/', {
+        'name': f'{author.username} new recipe',
+        'text': 'text',
+        'cooking_time': 5,
+        'image': image_base64,
+        'tags': [scenario_data.tags[0].pk],
+        'ingredients': [{'id': scenario_data.ingredients[0].pk,
+                         'amount': 1}],
+    }, format='json')
+    assert response.status_code == HTTPStatus.CREATED
+    return Recipe.objects.get(pk=response.json()['id'])
+
+
+def test_feed_pages_by_cursor(scenario):
+    data = scenario(3)
+    assert feed_ids(data.client, limit=2) == newest_first(data.recipes)
+
+
+def test_new_recipe_is_fanned_out(scenario, image_base64):
+    data = scenario(2)
+    recipe = create_recipe(data.authors[0], data, image_base64)
+    assert FeedEntry.objects.filter(user=data.user, recipe=recipe).exists()
+    assert feed_ids(data.client)[0] == recipe.pk
+
+
+def test_popular_authors_are_pulled(settings, scenario, image_base64):
+    settings.FEED_FANOUT_MAX_FOLLOWERS = 0
+    data = scenario(2)
+    recipe = create_recipe(data.authors[0], data, image_base64)
+    recipe.refresh_from_db()
+    assert not recipe.feed_fanout
+    assert not FeedEntry.objects.filter(recipe=recipe).exists()
+    assert feed_ids(data.client, limit=1) == newest_first(
+        [*data.recipes, recipe])
+
+
+def test_follow_and_unfollow(scenario):
+    data = scenario(2)
+    author = data.authors[0]
+    recipes = [recipe for recipe in data.recipes if recipe.author == author]
+    response = data.client.delete(f'/api/users/{author.pk}/subscribe/')
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert not set(feed_ids(data.client)) & {recipe.pk for recipe in recipes}
+    response = data.client.post(f'/api/users/{author.pk}/subscribe/')
+    assert response.status_code == HTTPStatus.CREATED
+    assert feed_ids(data.client) == newest_first(data.recipes)
@@ -0,0 +1,30 @@
+import pytest
+from django.core.management import CommandError, call_command
+
+from recipes.models import Ingredient
+
+
+@pytest.mark.parametrize('file_format, content, message', (
+    ('csv', 'соль,г\n\nперец\n', 'Line 3: name and measurement unit'),
+    ('csv', 'соль,г\n,шт.\n', 'Line 2: empty value'),
+    ('json', '[{"name": "соль", "measurement_unit": "г"}, {"name": "x"}]',
+     'Item 2: "name" and "measurement_unit"'),
+    ('json', '["соль"]', 'Item 1: "name" and "measurement_unit"'),
+    ('json', '{"name": "соль"}', 'list of ingredients'),
+    ('json', '[{"name": "соль",', 'Invalid JSON'),
+))
+def test_malformed_rows_are_reported(db, tmp_path, file_format, content,
+                                     message):
+    path = tmp_path / f'ingredients.{file_format}'
+    path.write_text(content, encoding='utf-8')
+    with pytest.raises(CommandError, match=message):
+        call_command('fill_base_with_ingredients', str(path))
+    assert not Ingredient.objects.exists()
+
+
+def test_ingredients_are_loaded(db, tmp_path):
+    path = tmp_path / 'ingredients.csv'
+    path.write_text('соль,г\n\nперец, г \nсоль,г\n', encoding='utf-8')
+    call_command('fill_base_with_ingredients', str(path))
+    assert set(Ingredient.objects.values_list(
+        'name', 'measurement_unit')) == {('соль', 'г'), ('перец', 'г')}
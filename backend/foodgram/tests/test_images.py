@@ -0,0 +1,84 @@
+import base64
+import json
+from http import HTTPStatus
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from recipes.images import rendition_names
+from recipes.models import Recipe
+
+
+def stored(name):
+    return [default_storage.exists(path)
+            for path in (name, *rendition_names(name))]
+
+
+def image_bytes(image_base64):
+    return base64.b64decode(image_base64.split(',', 1)[1])
+
+
+def replace_image(client, recipe, image_base64):
+    response = client.put(f'/api/recipes/{recipe.pk}/image/',
+                          {'image': image_base64}, format='json')
+    assert response.status_code == HTTPStatus.ACCEPTED
+    recipe.refresh_from_db()
+    return recipe.image.name
+
+
+def test_replaced_images_are_deleted(transactional_db, scenario,
+                                     image_base64):
+    data = scenario(2)
+    recipe = data.own_recipe
+    first = replace_image(data.client, recipe, image_base64)
+    assert all(stored(first))
+    second = replace_image(data.client, recipe, image_base64)
+    assert second != first
+    assert not any(stored(first))
+    assert all(stored(second))
+
+
+def test_shared_images_are_kept(transactional_db, scenario, image_base64):
+    data = scenario(2)
+    recipe = data.own_recipe
+    shared = replace_image(data.client, recipe, image_base64)
+    Recipe.objects.filter(pk=data.recipes[0].pk).update(image=shared)
+    replace_image(data.client, recipe, image_base64)
+    assert all(stored(shared))
+
+
+def test_multipart_create(transactional_db, scenario, image_base64):
+    data = scenario(2)
+    response = data.client.post('/api/recipes/', {
+        'name': 'multipart recipe', 'text': 'text', 'cooking_time': 5,
+        'tags': [tag.pk for tag in data.tags],
+        'ingredients': json.dumps(
+            [{'id': data.ingredients[0].pk, 'amount': 10}]),
+        'image': SimpleUploadedFile(
+            'image.png', image_bytes(image_base64), 'image/png'),
+    }, format='multipart')
+    assert response.status_code == HTTPStatus.CREATED
+    recipe = Recipe.objects.get(pk=response.json()['id'])
+    assert recipe.tags.count() == len(data.tags)
+    assert all(stored(recipe.image.name))
+
+
+def test_raw_image_upload(transactional_db, scenario, image_base64):
+    data = scenario(2)
+    url = f'/api/recipes/{data.own_recipe.pk}/image/'
+    response = data.client.put(url, image_bytes(image_base64),
+                               content_type='image/png')
+    assert response.status_code == HTTPStatus.ACCEPTED
+    data.own_recipe.refresh_from_db()
+    assert data.own_recipe.image.name != 'recipes/image.jpg'
+    assert all(stored(data.own_recipe.image.name))
+
+
+def test_only_the_author_uploads_images(scenario, image_base64):
+    data = scenario(2)
+    url = f'/api/recipes/{data.recipes[0].pk}/image/'
+    response = data.client.put(url, image_bytes(image_base64),
+                               content_type='image/png')
+    assert response.status_code == HTTPStatus.FORBIDDEN
+    response = data.client.put(url, {'image': image_base64}, format='json')
+    assert response.status_code == HTTPStatus.FORBIDDEN
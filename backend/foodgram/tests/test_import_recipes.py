@@ -0,0 +1,55 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from recipes.models import Recipe
+
+
+def exported_records(tmp_path):
+    path = tmp_path / 'recipes.jsonl'
+    call_command('export_recipes', str(path), stderr=StringIO())
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def import_records(tmp_path, records):
+    path = tmp_path / 'import.jsonl'
+    path.write_text('\n\n'.join(json.dumps(record) for record in records))
+    call_command('import_recipes', str(path), stdout=StringIO(),
+                 stderr=StringIO())
+
+
+def test_round_trip(scenario, tmp_path):
+    data = scenario(2)
+    records = exported_records(tmp_path)
+    Recipe.objects.all().delete()
+    import_records(tmp_path, records)
+    assert Recipe.objects.count() == len(data.recipes) + 1
+
+
+@pytest.mark.parametrize('change, message', (
+    (lambda record: record.pop('text'), '"text" must be'),
+    (lambda record: record.update(cooking_time='5'), '"cooking_time"'),
+    (lambda record: record.update(pub_date='yesterday'), '"pub_date"'),
+    (lambda record: record.update(author=None), '"author" must be'),
+    (lambda record: record.update(image='../secret.jpg'), '"image"'),
+    (lambda record: record['tags'].append(dict(record['tags'][0])),
+     'is repeated'),
+    (lambda record: record['tags'][0].update(color='red'), '"tags.color"'),
+    (lambda record: record['tags'][0].update(name='другой'),
+     'differs from the existing one'),
+    (lambda record: record['ingredients'][0].pop('amount'),
+     '"ingredients.amount"'),
+    (lambda record: record['ingredients'].append(
+        dict(record['ingredients'][0])), 'is repeated'),
+))
+def test_malformed_records_are_reported(scenario, tmp_path, change,
+                                        message):
+    scenario(2)
+    records = exported_records(tmp_path)
+    Recipe.objects.all().delete()
+    change(records[1])
+    with pytest.raises(CommandError, match=f'Line 3: .*{message}'):
+        import_records(tmp_path, records)
+    assert not Recipe.objects.exists()
@@ -0,0 +1,67 @@
+import json
+from http import HTTPStatus
+
+import pytest
+from rest_framework.test import APIClient
+
+from api.metrics import new_entry, registry
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    registry.reset()
+
+
+@pytest.fixture
+def staff_client(django_user_model):
+    user = django_user_model.objects.create(
+        username='staff', email='staff@example.com', is_staff=True)
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def test_metrics_are_staff_only(scenario):
+    data = scenario(1)
+    assert APIClient().get('/api/metrics').status_code == (
+        HTTPStatus.UNAUTHORIZED)
+    assert data.client.get('/api/metrics').status_code == (
+        HTTPStatus.FORBIDDEN)
+
+
+def test_requests_are_recorded_by_view(scenario, staff_client):
+    data = scenario(2)
+    data.client.get('/api/recipes/')
+    data.client.get('/api/recipes/')
+    b''.join(data.client.get(
+        '/api/recipes/download_shopping_cart/?format=txt'
+    ).streaming_content)
+    data.client.get('/api/missing/')
+    response = staff_client.get('/api/metrics')
+    assert response.status_code == HTTPStatus.OK
+    assert response['Content-Type'].startswith('text/plain')
+    content = response.content.decode()
+    assert ('foodgram_http_requests_total{view="RecipeViewSet.list",'
+            'method="GET",status="200"} 2') in content
+    assert ('foodgram_http_request_duration_seconds_count'
+            '{view="RecipeViewSet.list",method="GET"} 2') in content
+    assert ('foodgram_http_requests_total{view="unresolved",'
+            'method="GET",status="404"} 1') in content
+    download = registry.collect()['RecipeViewSet.download_shopping_cart GET']
+    assert download['bytes'] > 0
+    assert download['queries_sum'] >= 1
+
+
+def test_workers_are_merged(settings, tmp_path, scenario, staff_client):
+    settings.METRICS_DIRECTORY = str(tmp_path)
+    worker = new_entry()
+    worker['duration'][0] = 3
+    worker['queries'][2] = 3
+    worker['queries_sum'] = 6
+    worker['statuses'] = {'200': 3}
+    (tmp_path / '1.json').write_text(
+        json.dumps({'RecipeViewSet.list GET': worker}))
+    scenario(1).client.get('/api/recipes/')
+    content = staff_client.get('/api/metrics').content.decode()
+    assert ('foodgram_http_requests_total{view="RecipeViewSet.list",'
+            'method="GET",status="200"} 4') in content
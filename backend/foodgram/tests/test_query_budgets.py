@@ -0,0 +1,113 @@
+"""Query budgets of the API actions.
+
+Every action is requested with a small and a large data set (page size,
+ingredients and tags per recipe, followed authors and their recipes
+grow together). The number of SQL queries, with empty caches, must not
+exceed the budget of the action and must not grow with the data.
+Background tasks run in place, so their queries are counted too."""
+from http import HTTPStatus
+
+import pytest
+
+SMALL, LARGE = 2, 5
+
+BUDGETS = {
+    'recipes-list': (6, lambda s, image: (
+        'get', f'/api/recipes/?limit={s.size}', None)),
+    'recipes-list?tags': (7, lambda s, image: (
+        'get', f'/api/recipes/?limit={s.size}&'
+        + '&'.join(f'tags={tag.slug}' for tag in s.tags), None)),
+    'recipes-list?is_favorited': (6, lambda s, image: (
+        'get', f'/api/recipes/?limit={s.size}&is_favorited=1', None)),
+    'recipes-list?is_in_shopping_cart': (6, lambda s, image: (
+        'get', f'/api/recipes/?limit={s.size}&is_in_shopping_cart=1',
+        None)),
+    'recipes-list?author': (7, lambda s, image: (
+        'get', f'/api/recipes/?limit={s.size}&author={s.authors[0].pk}',
+        None)),
+    'recipes-list?search': (6, lambda s, image: (
+        'get', f'/api/recipes/?limit={s.size}&search=recipe', None)),
+    'recipes-list?ordering': (6, lambda s, image: (
+        'get', f'/api/recipes/?limit={s.size}&ordering=-favorites_count',
+        None)),
+    'recipes-detail': (5, lambda s, image: (
+        'get', f'/api/recipes/{s.recipes[0].pk}/', None)),
+    'recipes-create': (23, lambda s, image: (
+        'post', '/api/recipes/', {
+            'name': f'new recipe {s.size}',
+            'text': 'text',
+            'cooking_time': 5,
+            'image': image,
+            'tags': [tag.pk for tag in s.tags],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 10}
+                for ingredient in s.ingredients[:s.size]
+            ],
+        })),
+    'recipes-partial-update': (21, lambda s, image: (
+        'patch', f'/api/recipes/{s.own_recipe.pk}/', {
+            'tags': [tag.pk for tag in s.tags[1:]],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 20}
+                for ingredient in s.ingredients[s.size // 2:]
+            ],
+        })),
+    'recipes-feed': (7, lambda s, image: (
+        'get', f'/api/recipes/feed/?limit={s.size}', None)),
+    'recipes-feed?cursor': (7, lambda s, image: (
+        'get', f'/api/recipes/feed/?limit={s.size}&cursor=' + (
+            s.client.get(f'/api/recipes/feed/?limit={s.size}')
+            .json()['next'].split('cursor=')[1]), None)),
+    'recipes-favorite': (6, lambda s, image: (
+        'post', f'/api/recipes/{s.recipes[-1].pk}/favorite/', None)),
+    'recipes-shopping-cart': (10, lambda s, image: (
+        'post', f'/api/recipes/{s.recipes[-1].pk}/shopping_cart/', None)),
+    'recipes-download-shopping-cart': (1, lambda s, image: (
+        'get', '/api/recipes/download_shopping_cart/?format=txt', None)),
+    'recipes-shopping-cart-summary': (1, lambda s, image: (
+        'get', '/api/recipes/shopping_cart_summary/', None)),
+    'users-list': (3, lambda s, image: ('get', '/api/users/', None)),
+    'users-detail': (2, lambda s, image: (
+        'get', f'/api/users/{s.authors[0].pk}/', None)),
+    'users-me': (0, lambda s, image: ('get', '/api/users/me/', None)),
+    'users-subscriptions': (4, lambda s, image: (
+        'get', '/api/users/subscriptions/', None)),
+    'users-subscriptions?recipes_limit': (4, lambda s, image: (
+        'get', '/api/users/subscriptions/?recipes_limit=1', None)),
+    'users-subscribe': (13, lambda s, image: (
+        'post', f'/api/users/{s.recipes[-1].author.pk}/subscribe/'
+                '?recipes_limit=3', None)),
+    'tags-list': (1, lambda s, image: ('get', '/api/tags/', None)),
+    'ingredients-list': (1, lambda s, image: (
+        'get', '/api/ingredients/', None)),
+    'ingredients-list?name': (1, lambda s, image: (
+        'get', f'/api/ingredients/?name=s{s.size}ingr', None)),
+}
+
+
+def format_queries(queries):
+    return '\n'.join(
+        f'{number}. {query["sql"]}'
+        for number, query in enumerate(queries, 1))
+
+
+@pytest.mark.parametrize('action', BUDGETS)
+def test_query_budget(action, scenario, count_queries, image_base64):
+    budget, request = BUDGETS[action]
+    counts = {}
+    for size in (SMALL, LARGE):
+        data = scenario(size)
+        if action == 'users-subscribe':
+            data.user.follower.all().delete()
+        response, queries = count_queries(
+            data.client, *request(data, image_base64))
+        assert response.status_code < HTTPStatus.BAD_REQUEST, (
+            f'{action}: {response.status_code} {response.content[:500]}')
+        assert len(queries) <= budget, (
+            f'{action} with size {size} made {len(queries)} queries, '
+            f'budget is {budget}:\n{format_queries(queries)}')
+        counts[size] = queries
+    assert len(counts[SMALL]) == len(counts[LARGE]), (
+        f'{action} made {len(counts[SMALL])} queries with size {SMALL} '
+        f'and {len(counts[LARGE])} with size {LARGE}:\n'
+        f'{format_queries(counts[LARGE])}')
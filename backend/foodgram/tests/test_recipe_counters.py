@@ -0,0 +1,81 @@
+from http import HTTPStatus
+
+import pytest
+from django.core.management import call_command
+
+from recipes.models import FavoriteRecipe, Recipe
+
+
+def counters(recipe):
+    recipe.refresh_from_db()
+    return recipe.favorites_count, recipe.in_carts_count
+
+
+def test_actions_update_counters(scenario):
+    data = scenario(2)
+    recipe = data.recipes[-1]
+    assert counters(recipe) == (0, 0)
+    data.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+    data.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+    assert counters(recipe) == (1, 1)
+    data.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+    assert counters(recipe) == (1, 1)
+    data.client.delete(f'/api/recipes/{recipe.pk}/favorite/')
+    data.client.delete(f'/api/recipes/{recipe.pk}/shopping_cart/')
+    assert counters(recipe) == (0, 0)
+
+
+def test_ordering_by_favorites_count(scenario):
+    data = scenario(3)
+    Recipe.objects.filter(pk=data.recipes[-1].pk).update(favorites_count=5)
+    response = data.client.get('/api/recipes/?ordering=-favorites_count')
+    assert response.status_code == HTTPStatus.OK
+    ids = [recipe['id'] for recipe in response.json()['results']]
+    assert ids[0] == data.recipes[-1].pk
+    assert ids[1:4] == [recipe.pk for recipe in reversed(data.recipes[:3])]
+
+
+def test_reconcile_command(scenario):
+    data = scenario(2)
+    Recipe.objects.update(favorites_count=7, in_carts_count=0)
+    call_command('reconcile_recipe_counters')
+    for recipe in data.recipes[:2]:
+        assert counters(recipe) == (1, 1)
+    assert counters(data.recipes[-1]) == (0, 0)
+
+
+@pytest.mark.parametrize('ordering', ('-favorites_count', 'favorites_count'))
+def test_cursor_pages_by_favorites_count(scenario, ordering):
+    data = scenario(3)
+    for count, recipe in enumerate(data.recipes):
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=count % 4)
+    expected = list(
+        Recipe.objects.order_by(ordering, '-pub_date', '-id')
+        .values_list('pk', flat=True))
+    url = f'/api/recipes/?ordering={ordering}&limit=4&cursor='
+    ids = []
+    while url:
+        response = data.client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        ids += [recipe['id'] for recipe in response.json()['results']]
+        url = response.json()['next']
+    assert ids == expected
+
+
+def test_counters_follow_deletes_outside_the_api(scenario):
+    data = scenario(2)
+    recipe = data.recipes[0]
+    assert counters(recipe) == (1, 1)
+    data.user.delete()
+    assert counters(recipe) == (0, 0)
+    assert not recipe.favorite_recipe.exists()
+
+
+def test_counters_follow_moved_rows(scenario):
+    data = scenario(2)
+    first, second = data.recipes[0], data.recipes[-1]
+    favorite = FavoriteRecipe.objects.get(user=data.user, recipe=first)
+    favorite.recipe = second
+    favorite.save()
+    assert counters(first) == (0, 1)
+    assert counters(second) == (1, 0)
@@ -0,0 +1,35 @@
+from http import HTTPStatus
+
+MISSING_ID = 10 ** 6
+
+
+def recipe_data(data, image_base64, **fields):
+    return {
+        'name': 'new recipe', 'text': 'text', 'cooking_time': 5,
+        'image': image_base64, 'tags': [data.tags[0].pk],
+        'ingredients': [{'id': data.ingredients[0].pk, 'amount': 10}],
+        **fields,
+    }
+
+
+def test_unknown_ingredients_are_listed(scenario, image_base64):
+    data = scenario(2)
+    response = data.client.post('/api/recipes/', recipe_data(
+        data, image_base64, ingredients=[
+            {'id': data.ingredients[0].pk, 'amount': 10},
+            {'id': MISSING_ID, 'amount': 1},
+            {'id': MISSING_ID + 1, 'amount': 1},
+        ]
+    ), format='json')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json()['ingredients'] == [
+        f'Ингредиенты не найдены: {MISSING_ID}, {MISSING_ID + 1}.']
+
+
+def test_unknown_tags_are_reported(scenario, image_base64):
+    data = scenario(2)
+    response = data.client.post('/api/recipes/', recipe_data(
+        data, image_base64, tags=[data.tags[0].pk, MISSING_ID]
+    ), format='json')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert str(MISSING_ID) in str(response.json()['tags'])
@@ -0,0 +1,82 @@
+from http import HTTPStatus
+
+import pytest
+
+from recipes.models import Ingredient, Recipe
+
+
+def search_ids(client, query):
+    response = client.get(f'/api/recipes/?limit=100&{query}')
+    assert response.status_code == HTTPStatus.OK
+    return {recipe['id'] for recipe in response.json()['results']}
+
+
+def test_search_by_name(scenario):
+    data = scenario(3)
+    expected = {
+        recipe.pk for recipe in data.recipes
+        if recipe.name.endswith('recipe 1')
+    }
+    assert search_ids(data.client, 'search=recipe 1') == expected
+
+
+def test_search_with_filters(scenario):
+    data = scenario(3)
+    favorites = {recipe.pk for recipe in data.recipes[:3]}
+    tags = '&'.join(f'tags={tag.slug}' for tag in data.tags)
+    found = search_ids(
+        data.client, f'search=author0&is_favorited=1&{tags}')
+    assert found == favorites
+
+
+def test_empty_search(scenario):
+    data = scenario(2)
+    assert search_ids(data.client, 'search=%20') == search_ids(
+        data.client, '')
+
+
+def test_search_ranks_name_above_text(scenario):
+    data = scenario(2)
+    text_match, name_match = data.recipes[-1], data.recipes[0]
+    Recipe.objects.filter(pk=text_match.pk).update(text='Borscht with garlic')
+    Recipe.objects.filter(pk=name_match.pk).update(name='Borscht')
+    Recipe.objects.filter(
+        pk__in=[text_match.pk, name_match.pk]).update_search_vector()
+    response = data.client.get('/api/recipes/?search=borscht')
+    assert response.status_code == HTTPStatus.OK
+    assert [recipe['id'] for recipe in response.json()['results']] == [
+        name_match.pk, text_match.pk]
+
+
+@pytest.mark.parametrize('query', (
+    'search=recipe&ordering=-favorites_count',
+    'search=recipe&cursor=',
+))
+def test_search_keeps_relevance_order(scenario, query):
+    data = scenario(2)
+    response = data.client.get(f'/api/recipes/?{query}')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def ingredient_names(client, query):
+    response = client.get(f'/api/ingredients/?{query}')
+    assert response.status_code == HTTPStatus.OK
+    return [ingredient['name'] for ingredient in response.json()]
+
+
+def test_ingredient_prefix_matches_first(transactional_db, scenario):
+    data = scenario(2)
+    for name in ('сливочное масло', 'Масло оливковое', 'масло'):
+        Ingredient.objects.create(name=name, measurement_unit='г')
+    assert ingredient_names(data.client, 'name=масло') == [
+        'масло', 'Масло оливковое', 'сливочное масло']
+    assert ingredient_names(data.client, 'name=масло&limit=2') == [
+        'масло', 'Масло оливковое']
+    assert ingredient_names(data.client, 'name=масло&limit=1') == ['масло']
+
+
+def test_new_ingredients_are_searchable(transactional_db, scenario):
+    data = scenario(2)
+    assert ingredient_names(data.client, 'name=фисташк') == []
+    Ingredient.objects.create(name='фисташки', measurement_unit='г')
+    assert ingredient_names(data.client, 'name=фисташк') == ['фисташки']
@@ -0,0 +1,98 @@
+from http import HTTPStatus
+
+from django.contrib.admin import site
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import (Ingredient, RecipeIngredient, ShoppingCart,
+                            ShoppingListItem)
+
+
+def assert_totals_in_step():
+    stored = set(ShoppingListItem.objects.values_list(
+        'user', 'ingredient', 'total_amount'))
+    assert stored == set(ShoppingListItem.objects.expected_totals())
+
+
+def test_cart_actions(scenario):
+    data = scenario(2)
+    recipe = data.recipes[-1]
+    response = data.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+    assert response.status_code == HTTPStatus.CREATED
+    assert_totals_in_step()
+    with CaptureQueriesContext(connection) as queries:
+        response = data.client.delete(
+            f'/api/recipes/{recipe.pk}/shopping_cart/')
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert_totals_in_step()
+    assert not any('SUM(' in query['sql']
+                   for query in queries.captured_queries)
+
+
+def test_carts_changed_outside_the_api(scenario):
+    data = scenario(2)
+    ShoppingCart.objects.create(user=data.user, recipe=data.recipes[-1])
+    assert_totals_in_step()
+    cart = ShoppingCart.objects.get(user=data.user, recipe=data.recipes[0])
+    cart.user = data.authors[0]
+    cart.save()
+    assert_totals_in_step()
+    ShoppingCart.objects.filter(recipe=data.recipes[1]).delete()
+    assert_totals_in_step()
+
+
+def test_recipe_updates_and_cascades(scenario):
+    data = scenario(3)
+    recipe = data.recipes[0]
+    response = data.client.patch(f'/api/recipes/{data.own_recipe.pk}/', {
+        'ingredients': [{'id': data.ingredients[-1].pk, 'amount': 7}],
+    }, format='json')
+    assert response.status_code == HTTPStatus.OK
+    ShoppingCart.objects.create(user=data.authors[1], recipe=recipe)
+    ShoppingCart.objects.create(user=data.user, recipe=data.recipes[-1])
+    response = data.client.patch(f'/api/recipes/{data.own_recipe.pk}/', {
+        'ingredients': [{'id': data.ingredients[0].pk, 'amount': 5}],
+    }, format='json')
+    assert_totals_in_step()
+    data.ingredients[1].delete()
+    assert_totals_in_step()
+    data.recipes[1].delete()
+    assert_totals_in_step()
+    data.authors[0].delete()
+    assert_totals_in_step()
+    assert ShoppingListItem.objects.filter(user=data.user).exists()
+
+
+def test_admin_edits_of_recipe_ingredients(scenario):
+    data = scenario(2)
+    admin = site._registry[RecipeIngredient]
+    recipe_ingredient = RecipeIngredient.objects.filter(
+        recipe=data.recipes[0]).first()
+    recipe_ingredient.amount += 100
+    admin.save_model(None, recipe_ingredient, None, True)
+    assert_totals_in_step()
+    recipe_ingredient.ingredient = data.ingredients[-1]
+    recipe_ingredient.recipe = data.recipes[-1]
+    admin.save_model(None, recipe_ingredient, None, True)
+    assert_totals_in_step()
+    admin.delete_queryset(None, RecipeIngredient.objects.filter(
+        recipe=data.recipes[1]))
+    assert_totals_in_step()
+    admin.delete_model(None, RecipeIngredient.objects.filter(
+        recipe=data.recipes[0]).first())
+    assert_totals_in_step()
+    assert Ingredient.objects.exists()
+
+
+def test_pdf_needs_a_cyrillic_font(scenario, settings):
+    data = scenario(2)
+    url = '/api/recipes/download_shopping_cart/?format=pdf'
+    response = data.client.get(url)
+    assert response.status_code == HTTPStatus.OK
+    assert b''.join(response.streaming_content).startswith(b'%PDF')
+    settings.SHOPPING_LIST_PDF_FONT = '/missing/font.ttf'
+    cache.clear()
+    response = data.client.get(url)
+    assert response.status_code == HTTPStatus.NOT_ACCEPTABLE
+    assert response['Content-Type'].startswith('text/plain')
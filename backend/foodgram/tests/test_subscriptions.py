@@ -0,0 +1,37 @@
+from http import HTTPStatus
+
+
+def test_recipes_limit(scenario):
+    data = scenario(3)
+    response = data.client.get('/api/users/subscriptions/?recipes_limit=2')
+    assert response.status_code == HTTPStatus.OK
+    authors = response.json()['results']
+    assert len(authors) == 3
+    for author in authors:
+        recipes = [
+            recipe for recipe in data.recipes
+            if recipe.author.pk == author['id']
+        ]
+        newest = sorted(recipes, key=lambda recipe: (recipe.pub_date,
+                                                     recipe.pk),
+                        reverse=True)[:2]
+        assert [recipe['id'] for recipe in author['recipes']] == [
+            recipe.pk for recipe in newest]
+        assert author['recipes_count'] == 3
+
+
+def test_without_recipes_limit(scenario):
+    data = scenario(2)
+    authors = data.client.get('/api/users/subscriptions/').json()['results']
+    assert [len(author['recipes']) for author in authors] == [2, 2]
+
+
+def test_subscribe_with_recipes_limit(scenario):
+    data = scenario(2)
+    author = data.authors[0]
+    data.user.follower.all().delete()
+    response = data.client.post(
+        f'/api/users/{author.pk}/subscribe/?recipes_limit=1')
+    assert response.status_code == HTTPStatus.CREATED
+    assert len(response.json()['recipes']) == 1
+    assert response.json()['recipes_count'] == 2
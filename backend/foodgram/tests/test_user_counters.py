@@ -0,0 +1,72 @@
+from http import HTTPStatus
+from io import StringIO
+
+from django.core.management import call_command
+
+from recipes.models import Recipe
+from users.models import Follow, User
+
+
+def counters(user):
+    user.refresh_from_db()
+    return user.recipes_count, user.followers_count, user.following_count
+
+
+def test_recipes_update_author_counter(scenario, image_base64):
+    data = scenario(2)
+    assert counters(data.user) == (1, 0, 2)
+    response = data.client.post('/api/recipes/', {
+        'name': 'new recipe', 'text': 'text', 'cooking_time': 5,
+        'image': image_base64, 'tags': [data.tags[0].pk],
+        'ingredients': [{'id': data.ingredients[0].pk, 'amount': 10}],
+    }, format='json')
+    assert response.status_code == HTTPStatus.CREATED
+    assert counters(data.user) == (2, 0, 2)
+    data.client.delete(f'/api/recipes/{response.json()["id"]}/')
+    data.own_recipe.delete()
+    assert counters(data.user) == (0, 0, 2)
+
+
+def test_subscribe_updates_follow_counters(scenario):
+    data = scenario(2)
+    author = data.authors[0]
+    assert counters(author) == (2, 1, 0)
+    response = data.client.delete(f'/api/users/{author.pk}/subscribe/')
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert counters(author) == (2, 0, 0)
+    assert counters(data.user) == (1, 0, 1)
+    response = data.client.post(f'/api/users/{author.pk}/subscribe/')
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.json()['followers_count'] == 1
+    assert response.json()['recipes_count'] == 2
+    assert counters(author) == (2, 1, 0)
+    assert counters(data.user) == (1, 0, 2)
+
+
+def test_repair_command(scenario):
+    data = scenario(2)
+    User.objects.update(recipes_count=9, followers_count=0)
+    output = StringIO()
+    call_command('repair_user_counters', '--verify', stdout=output)
+    assert 'Mismatched users: 3' in output.getvalue()
+    assert counters(data.user) == (9, 0, 2)
+    call_command('repair_user_counters', stdout=StringIO())
+    assert counters(data.user) == (1, 0, 2)
+    assert counters(data.authors[1]) == (2, 1, 0)
+    assert Recipe.objects.filter(author=data.authors[1]).count() == 2
+
+
+def test_follows_changed_outside_the_api(scenario):
+    data = scenario(2)
+    first, second = data.authors
+    follow = Follow.objects.get(user=data.user, author=first)
+    follow.author = data.authors[1]
+    Follow.objects.filter(user=data.user, author=second).delete()
+    assert counters(data.user) == (1, 0, 1)
+    follow.save()
+    assert counters(first) == (2, 0, 0)
+    assert counters(second) == (2, 1, 0)
+    Follow.objects.create(user=first, author=second)
+    second.delete()
+    assert counters(data.user) == (1, 0, 0)
+    assert counters(first) == (2, 0, 0)
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from users.models import User
+
+COUNTERS = ('recipes_count', 'followers_count', 'following_count')
+
+
+def find_mismatches():
+    """Returns users whose counters differ from their relations,
+    annotated with the expected_<counter> values"""
+    expected = {
+        f'expected_{field}': count
+        for field, count in User.objects.counted_relations().items()
+    }
+    mismatched = Q()
+    for field in COUNTERS:
+        mismatched |= ~Q(**{field: F(f'expected_{field}')})
+    return (
+        User.objects.annotate(**expected).filter(mismatched).order_by('pk')
+    )
+
+
+class Command(BaseCommand):
+    """Verifying and repairing recipe and follow counters of users"""
+    help = ('Recounts "recipes_count", "followers_count" and '
+            '"following_count" of users from the recipes and the follows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='only report users with wrong counters')
+
+    def handle(self, *args, **options):
+        mismatches = list(find_mismatches().values_list(
+            'pk', *(name for field in COUNTERS
+                    for name in (field, f'expected_{field}'))))
+        for pk, *values in mismatches:
+            self.stdout.write(f'user {pk}: ' + '; '.join(
+                f'{field[:-len("_count")]} {value}, expected {expected}'
+                for field, value, expected in zip(
+                    COUNTERS, values[::2], values[1::2])))
+        if options['verify']:
+            self.stdout.write(f'Mismatched users: {len(mismatches)}')
+            return
+        updated = User.objects.filter(
+            pk__in=[pk for pk, *_ in mismatches]).update_counters()
+        self.stdout.write(f'User counters are repaired: {updated}.')
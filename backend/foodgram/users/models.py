@@ -1,6 +1,42 @@
-from django.contrib.auth.models import AbstractUser
+from django.apps import apps
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.validators import RegexValidator
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+class UserQuerySet(models.QuerySet):
+    """Denormalized counters of authors and follows"""
+
+    @staticmethod
+    def counted_relations():
+        """Counter fields with the actual counts of their relations"""
+        relations = (
+            ('recipes_count', apps.get_model('recipes', 'Recipe'), 'author'),
+            ('followers_count', Follow, 'author'),
+            ('following_count', Follow, 'user'),
+        )
+        return {
+            field: Coalesce(Subquery(
+                model.objects.filter(**{lookup: OuterRef('pk')}).order_by()
+                .values(lookup).annotate(count=Count('id')).values('count'),
+                output_field=models.IntegerField()
+            ), 0)
+            for field, model, lookup in relations
+        }
+
+    def update_counters(self):
+        """Recounts recipes, followers and follows of the users"""
+        return self.update(**self.counted_relations())
+
+    def change_counter(self, field, delta):
+        """Atomically adds delta to the counter field, never below zero"""
+        return self.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+class CountersUserManager(UserManager.from_queryset(UserQuerySet)):
+    """UserManager with the counter helpers of UserQuerySet"""
 
 
 class User(AbstractUser):
@@ -51,6 +87,23 @@ class User(AbstractUser):
     is_staff = models.BooleanField(default=False)
     first_name = models.CharField(max_length=150, blank=True)
     last_name = models.CharField(max_length=150, blank=True)
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во подписок'
+    )
+
+    objects = CountersUserManager()
 
     @property
     def is_admin(self):
@@ -92,6 +145,12 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписка на авторов'
         verbose_name_plural = 'Подписки на авторов'
+        indexes = [
+            models.Index(
+                fields=('author', 'user'),
+                name='follow_author_user_idx'
+            )
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=('user', 'author'),
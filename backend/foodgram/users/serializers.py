@@ -7,21 +7,44 @@ from rest_framework import serializers
 from .models import Follow, User
 
 
-class UserGetSerializer(UserSerializer):
+def get_followed_authors(request):
+    """Returns ids of authors followed by the request user.
+    Loaded once and memoized on the request."""
+    if request is None or request.user.is_anonymous:
+        return frozenset()
+    if not hasattr(request, 'followed_authors'):
+        request.followed_authors = set(
+            Follow.objects.filter(user=request.user)
+            .values_list('author', flat=True)
+        )
+    return request.followed_authors
+
+
+class SubscribedMixin:
+    """"is_subscribed" field method for serializers of authors."""
+
+    def get_is_subscribed(self, obj):
+        return obj.pk in get_followed_authors(self.context.get('request'))
+
+
+class UserGetSerializer(SubscribedMixin, UserSerializer):
     """GET-method: User list."""
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ('id', 'email', 'username', 'first_name',
-                  'last_name', 'is_subscribed')
+                  'last_name', 'is_subscribed', 'recipes_count',
+                  'followers_count', 'following_count')
 
-    def get_is_subscribed(self, obj):
-        if (self.context.get('request')
-                and not self.context['request'].user.is_anonymous):
-            return Follow.objects.filter(user=self.context['request'].user,
-                                         author=obj).exists()
-        return False
+
+class AuthorSerializer(UserGetSerializer):
+    """Author of cached recipe payloads, without the counters
+    that change far more often than the payloads"""
+
+    class Meta(UserGetSerializer.Meta):
+        fields = ('id', 'email', 'username', 'first_name',
+                  'last_name', 'is_subscribed')
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -1,6 +1,11 @@
 from http import HTTPStatus
 
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django.shortcuts import get_object_or_404
+from recipes.background import run_in_background
+from recipes.models import FeedEntry, Recipe
+from recipes.tasks import backfill_feed
 from rest_framework import mixins, viewsets
 from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
@@ -13,6 +18,23 @@ from .serializers import (CustomUserCreateSerializer, SetPasswordSerializer,
                           UserGetSerializer)
 
 
+def get_recipes_limit(request):
+    limit = request.query_params.get('recipes_limit')
+    return int(limit) if limit and limit.isdigit() else None
+
+
+def with_recipe_previews(authors, request):
+    """Loads at most ?recipes_limit= newest recipes of every author
+    into "recipe_previews" with one query"""
+    recipes = Recipe.objects.filter(author__in=authors)
+    limit = get_recipes_limit(request)
+    if limit is not None:
+        recipes = recipes.newest_per_author(limit)
+    prefetch_related_objects(authors, Prefetch(
+        'recipes', queryset=recipes, to_attr='recipe_previews'))
+    return authors
+
+
 class ListRetrieveCreateModelMixin(mixins.CreateModelMixin,
                                    mixins.ListModelMixin,
                                    mixins.RetrieveModelMixin):
@@ -51,8 +73,9 @@ class UserViewSet(ListRetrieveCreateModelMixin,
             permission_classes=(IsAuthenticated,),
             pagination_class=PageNumberPagination)
     def subscriptions(self, request):
-        queryset = User.objects.filter(following__user=request.user)
-        page = self.paginate_queryset(queryset)
+        queryset = User.objects.filter(
+            following__user=request.user).order_by('-following__id')
+        page = with_recipe_previews(self.paginate_queryset(queryset), request)
         serializer = FollowSerializer(page, many=True,
                                       context={'request': request})
         return self.get_paginated_response(serializer.data)
@@ -60,18 +83,25 @@ class UserViewSet(ListRetrieveCreateModelMixin,
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(IsAuthenticated,))
     def subscribe(self, request, **kwargs):
-        author = get_object_or_404(User, id=kwargs['pk'])
-
         if request.method == 'POST':
+            author = get_object_or_404(User, id=kwargs['pk'])
+            with_recipe_previews([author], request)
             serializer = FollowAuthorSerializer(
                 author, data=request.data, context={"request": request})
             serializer.is_valid(raise_exception=True)
-            Follow.objects.create(user=request.user, author=author)
+            with transaction.atomic():
+                Follow.objects.create(user=request.user, author=author)
+            author.followers_count += 1
+            run_in_background(backfill_feed, request.user.pk, author.pk)
             return Response(serializer.data,
                             status=HTTPStatus.CREATED)
 
         if request.method == 'DELETE':
-            get_object_or_404(Follow, user=request.user,
-                              author=author).delete()
+            author = get_object_or_404(User, id=kwargs['pk'])
+            follow = get_object_or_404(Follow, user=request.user,
+                                       author=author)
+            with transaction.atomic():
+                follow.delete()
+                FeedEntry.objects.remove_author(request.user.pk, author.pk)
             return Response({'detail': 'Успешная отписка'},
                             status=HTTPStatus.NO_CONTENT)